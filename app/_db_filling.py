@@ -1,178 +1,549 @@
 import asyncio
 import random
 import string
+import time
 from asyncio import Queue
+from dataclasses import dataclass, field
+from datetime import timedelta
 from itertools import chain
-from typing import Optional, Sequence
-
-import httpx
-from config import SelfService
-from db.base import get_session
-from db.models import Author, Book, Category, Review
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from cache import result_cache
+from config import (
+    CRAWL_BATCH_TERMS,
+    CRAWL_MAX_TERMS,
+    CRAWL_STALE_AFTER,
+    FILLING_BATCH_SIZE,
+    FILLING_FLUSH_INTERVAL,
+    FILLING_REVIEWS_BATCH_SIZE,
+    FILLING_USERS_PAGE_SIZE,
+    FILLING_WRITERS,
+    SelfService,
+    logger,
+)
+from db.base import dialect_insert, get_session
+from db.crawl import CrawlPlan, TermStats, plan_crawl, record_crawl, start_crawl
+from db.models import Author, Book, Category, Review, book_authors, book_categories, ulid
+from db.ratings import rebuild_rating_stats
 from faker import Faker
+from google_books import google_books
+from metrics import BOOKS_INSERTED, FILLING_QUEUE_DEPTH
 from patisson_request.graphql.queries import QUser
 from patisson_request.service_routes import UsersRoute
-from sqlalchemy.exc import IntegrityError
+from search import text_index
+from sqlalchemy import Insert, Table, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-URL = "https://www.googleapis.com/books/v1/volumes?q={}"
 fake = Faker()
 
 
-async def _add_author(session: AsyncSession, name: str):
-    author = await session.get(Author, name)
-    if not author:
-        author = Author(name=name)
-        session.add(author)
-        await session.commit()
-    return author
+@dataclass
+class BatchReport:
+    """Numbers of rows inserted and skipped as already existing by one batch write."""
+
+    books_inserted: int = 0
+    books_skipped: int = 0
+    authors_inserted: int = 0
+    authors_skipped: int = 0
+    categories_inserted: int = 0
+    categories_skipped: int = 0
+    book_authors_inserted: int = 0
+    book_categories_inserted: int = 0
+    google_ids: set[str] = field(default_factory=set, repr=False)
+
+
+@dataclass
+class WriterStats:
+    """Throughput of one writer of the database filling."""
+
+    worker: int
+    batches: int = 0
+    books_inserted: int = 0
+    books_skipped: int = 0
+    busy: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+    google_ids: set[str] = field(default_factory=set, repr=False)
+
+    @property
+    def books_per_second(self) -> float:
+        return self.books_inserted / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"writer {self.worker}: {self.batches} batches, {self.books_inserted} books inserted, "
+            f"{self.books_skipped} skipped in {self.elapsed:.1f}s ({self.books_per_second:.1f} books/s, "
+            f"{self.busy / self.elapsed if self.elapsed else 0:.0%} busy)"
+        )
 
 
-async def _add_category(session: AsyncSession, name: str):
-    category = await session.get(Category, name)
-    if not category:
-        category = Category(name=name)
-        session.add(category)
-        await session.commit()
-    return category
+def _insert_ignore(session: AsyncSession, table: Table) -> Insert:
+    """Build a multi-row INSERT ... ON CONFLICT DO NOTHING for the dialect of the session."""
+    return dialect_insert(session, table).on_conflict_do_nothing()
+
+
+def _book_row(book_data: dict) -> Optional[dict]:
+    volume_info: dict = book_data.get("volumeInfo", {})
+    if not book_data.get("id") or not volume_info.get("title"):
+        return None
+    return {
+        "id": ulid(),
+        "google_id": book_data["id"],
+        "title": volume_info["title"],
+        "publisher": volume_info.get("publisher"),
+        "publishedDate": volume_info.get("publishedDate"),
+        "description": volume_info.get("description"),
+        "pageCount": volume_info.get("pageCount"),
+        "maturityRating": volume_info.get("maturityRating"),
+        "smallThumbnail": volume_info.get("imageLinks", {}).get("smallThumbnail"),
+        "thumbnail": volume_info.get("imageLinks", {}).get("thumbnail"),
+        "language": volume_info.get("language"),
+    }
+
+
+async def _write_batch(session: AsyncSession, books_data: Sequence[dict]) -> BatchReport:
+    """
+    Write a batch of Google Books volumes in one transaction.
+
+    Args:
+        session (AsyncSession): The session used for the write.
+        books_data (Sequence[dict]): The volumes as returned by the Google Books API.
+
+    Returns:
+        BatchReport: The numbers of inserted and skipped rows and the `google_id` of the new books.
+
+    Notes:
+        Books are deduplicated by `google_id`; a book that already exists is skipped together
+        with its authors and categories, as the associations of existing books are left untouched.
+        The same holds when another writer inserts the same book concurrently: the conflicting
+        insert waits for the other transaction and is then ignored. Every table is written in
+        key order, so concurrent writers lock the rows they share in the same order and cannot
+        deadlock each other.
+    """
+    report = BatchReport()
+    rows: dict[str, dict] = {}
+    volumes: dict[str, dict] = {}
+    for book_data in books_data:
+        row = _book_row(book_data)
+        if row is None or row["google_id"] in rows:
+            report.books_skipped += 1
+            continue
+        rows[row["google_id"]] = row
+        volumes[row["google_id"]] = book_data.get("volumeInfo", {})
+    if not rows:
+        return report
 
-
-async def _add_book(session: AsyncSession, book_data: dict):
     try:
-        volume_info: dict = book_data.get("volumeInfo", {})
-        book_id = book_data.get("id")
-        existing_book = await session.execute(select(Book).filter_by(google_id=book_id))
-        if existing_book.scalars().first():
-            return
-
-        book = Book(
-            google_id=book_id,
-            title=volume_info.get("title"),
-            publisher=volume_info.get("publisher"),
-            publishedDate=volume_info.get("publishedDate"),
-            description=volume_info.get("description"),
-            pageCount=volume_info.get("pageCount"),
-            maturityRating=volume_info.get("maturityRating"),
-            smallThumbnail=volume_info.get("imageLinks", {}).get("smallThumbnail"),
-            thumbnail=volume_info.get("imageLinks", {}).get("thumbnail"),
-            language=volume_info.get("language"),
+        result = await session.execute(
+            _insert_ignore(session, Book.__table__).returning(Book.__table__.c.google_id),
+            [rows[google_id] for google_id in sorted(rows)],
         )
-
-        for author_name in volume_info.get("authors", []):
-            author = await _add_author(session, author_name)
-            book.authors.append(author)
-
-        for category_name in volume_info.get("categories", []):
-            category = await _add_category(session, category_name)
-            book.categories.append(category)
-
-        session.add(book)
-
-        await session.commit()
-    except IntegrityError:
-        pass
-
-
-async def _add_review(user_id: str, book_id: str, stars: int, comment: str, actual: bool = True) -> Review:
-    async with get_session() as session:
-        review = Review(user_id=user_id, book_id=book_id, stars=stars, comment=comment, actual=actual)
-        session.add(review)
+        inserted = set(result.scalars().all())
+        report.google_ids = inserted
+        report.books_inserted = len(inserted)
+        report.books_skipped += len(rows) - len(inserted)
+
+        book_authors_rows = {
+            (rows[google_id]["id"], name)
+            for google_id in inserted
+            for name in volumes[google_id].get("authors", [])
+        }
+        book_categories_rows = {
+            (rows[google_id]["id"], name)
+            for google_id in inserted
+            for name in volumes[google_id].get("categories", [])
+        }
+        authors = {name for _, name in book_authors_rows}
+        categories = {name for _, name in book_categories_rows}
+
+        if authors:
+            result = await session.execute(
+                _insert_ignore(session, Author.__table__).returning(Author.__table__.c.name),
+                [{"name": name} for name in sorted(authors)],
+            )
+            report.authors_inserted = len(result.scalars().all())
+            report.authors_skipped = len(authors) - report.authors_inserted
+        if categories:
+            result = await session.execute(
+                _insert_ignore(session, Category.__table__).returning(Category.__table__.c.name),
+                [{"name": name} for name in sorted(categories)],
+            )
+            report.categories_inserted = len(result.scalars().all())
+            report.categories_skipped = len(categories) - report.categories_inserted
+        if book_authors_rows:
+            await session.execute(
+                _insert_ignore(session, book_authors),
+                [{"book_id": book_id, "author_name": name} for book_id, name in sorted(book_authors_rows)],
+            )
+            report.book_authors_inserted = len(book_authors_rows)
+        if book_categories_rows:
+            await session.execute(
+                _insert_ignore(session, book_categories),
+                [
+                    {"book_id": book_id, "category_name": name}
+                    for book_id, name in sorted(book_categories_rows)
+                ],
+            )
+            report.book_categories_inserted = len(book_categories_rows)
         await session.commit()
-        return review
-
-
-async def _fetch_books_data(client: httpx.AsyncClient, query: str):
-    books_data = []
-    response = await client.get(URL.format(query))
-    if response.status_code == 200:
-        result = response.json()
-        if "items" in result:
-            books_data.extend(result["items"])
-    return books_data
-
-
-async def _process_query(query: str, queue: Queue) -> None:
-    async with httpx.AsyncClient() as client:
-        books_data = await _fetch_books_data(client, query)
+    except Exception:
+        await session.rollback()
+        raise
+    if text_index.built:
+        for google_id in inserted:
+            text_index.add(rows[google_id]["id"], rows[google_id]["title"], rows[google_id]["description"])
+    if inserted:
+        tags = {"book:*"}
+        # a new book changes the nested books of its authors and categories, new or not
+        if book_authors_rows:
+            tags |= {"author:*"} | {f"author:{name}" for _, name in book_authors_rows}
+        if book_categories_rows:
+            tags |= {"category:*"} | {f"category:{name}" for _, name in book_categories_rows}
+        await result_cache.invalidate(tags)
+    BOOKS_INSERTED.inc(amount=report.books_inserted)
+    return report
+
+
+async def _process_query(query: str, queue: Queue, found: Optional[TermStats] = None) -> set[str]:
+    google_ids = set()
+    async for books_data in google_books.volumes(query):
         for book_data in books_data:
             await queue.put(book_data)
+            google_ids.add(book_data.get("id"))
+        FILLING_QUEUE_DEPTH.set(queue.qsize())
+        if found is not None:
+            found.pages += 1
+    if found is not None:
+        found.books_found = len(google_ids)
+    return google_ids
+
+
+async def _next_batch(queue: Queue) -> tuple[list[dict], bool]:
+    """
+    Take up to `FILLING_BATCH_SIZE` volumes from the queue.
+
+    Returns:
+        tuple[list[dict], bool]: The volumes and whether the end-of-queue sentinel was reached.
+
+    Notes:
+        After the first volume, the batch is flushed as soon as `FILLING_FLUSH_INTERVAL`
+        seconds pass without it being filled.
+    """
+    batch: list[dict] = []
+    book_data = await queue.get()
+    if book_data is None:
+        return batch, True
+    batch.append(book_data)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + FILLING_FLUSH_INTERVAL
+    while len(batch) < FILLING_BATCH_SIZE:
+        try:
+            book_data = await asyncio.wait_for(queue.get(), deadline - loop.time())
+        except TimeoutError:
+            break
+        if book_data is None:
+            return batch, True
+        batch.append(book_data)
+    FILLING_QUEUE_DEPTH.set(queue.qsize())
+    return batch, False
+
+
+async def _add_books_to_db(
+    queue: Queue, worker: int = 0, session: Optional[AsyncSession] = None
+) -> WriterStats:
+    """
+    Write the volumes of the queue in batches until an end-of-queue sentinel is taken.
+
+    Args:
+        queue (Queue): The volumes fetched from Google Books, followed by one `None` per writer.
+        worker (int): The number of the writer, for the stats.
+        session (Optional[AsyncSession]): The session to write with; a new one is opened if omitted.
+
+    Returns:
+        WriterStats: The throughput of the writer.
+    """
+    stats = WriterStats(worker)
 
-
-async def _add_books_to_db(queue: Queue, session: Optional[AsyncSession] = None):
     async def body(session: AsyncSession):
-        while True:
-            book_data = await queue.get()
-            if book_data is None:
-                break
-            await _add_book(session, book_data)
-            queue.task_done()
+        finished = False
+        while not finished:
+            batch, finished = await _next_batch(queue)
+            if batch:
+                started = time.perf_counter()
+                report = await _write_batch(session, batch)
+                stats.busy += time.perf_counter() - started
+                stats.batches += 1
+                stats.books_inserted += report.books_inserted
+                stats.books_skipped += report.books_skipped
+                stats.google_ids |= report.google_ids
+                logger.info(f"writer {worker}: {report}")
 
     if session:
         await body(session)
     else:
         async with get_session() as session:
             await body(session)
+    stats.elapsed = time.perf_counter() - stats.started
+    logger.info(stats)
+    return stats
+
 
+async def _crawl(terms: Sequence[str]) -> CrawlPlan:
+    """
+    Crawl the search terms that are new, stale or interrupted, and record their crawl state.
 
-async def _adding_books_by_authors(session: Optional[AsyncSession] = None):
+    Args:
+        terms (Sequence[str]): The candidate search terms.
+
+    Returns:
+        CrawlPlan: The crawled terms with their outcome and the skipped ones.
+
+    Notes:
+        The terms are crawled `CRAWL_BATCH_TERMS` at a time, and the state of a batch is
+        recorded once its books are written, so an interrupted run loses at most one batch.
+    """
+    async with get_session() as session:
+        plan = await plan_crawl(session, terms, timedelta(days=CRAWL_STALE_AFTER), CRAWL_MAX_TERMS)
+    for start in range(0, len(plan.terms), CRAWL_BATCH_TERMS):
+        end = start + CRAWL_BATCH_TERMS
+        batch = plan.terms[start:end]
+        async with get_session() as session:
+            await start_crawl(session, batch)
+        crawled = {term: TermStats() for term in batch}
+        await filling_db(batch, terms=crawled)
+        async with get_session() as session:
+            await record_crawl(session, crawled)
+        plan.crawled.update(crawled)
+    logger.info(plan)
+    return plan
+
+
+async def _adding_books_by_authors(session: Optional[AsyncSession] = None) -> CrawlPlan:
     async with get_session() as session:
         result = await session.execute(select(Author.name))
         authors = result.scalars().unique().all()
-        await filling_db([f"inauthor:{author}" for author in authors])
+    return await _crawl([f"inauthor:{author}" for author in authors])
 
 
-async def _adding_books_by_categories(session: Optional[AsyncSession] = None):
+async def _adding_books_by_categories(session: Optional[AsyncSession] = None) -> CrawlPlan:
     async with get_session() as session:
         result = await session.execute(select(Category.name))
         categories = result.scalars().unique().all()
-        await filling_db([f"subject:{category}" for category in categories])
+    return await _crawl([f"subject:{category}" for category in categories])
 
 
-async def _filling_review(session: Optional[AsyncSession] = None):
-    async def body(session: AsyncSession):
-        users = await SelfService.post_request(*-UsersRoute.graphql.users(fields=[QUser.id], limit=0))
-        result = await session.execute(select(Book.id))
-        books = result.scalars().unique().all()
-
-        tasks = [
-            _add_review(
-                user_id=user.id,
-                book_id=random.choice(books),
-                stars=random.randint(1, 5),
-                comment=fake.text(),
-                actual=True if random.randint(1, 10) > 8 else False,
+async def _user_pages() -> AsyncIterator[list[str]]:
+    """Yield the IDs of the users of the Users service, page by page."""
+    offset = 0
+    while True:
+        response = await SelfService.post_request(
+            *-UsersRoute.graphql.users(fields=[QUser.id], offset=offset, limit=FILLING_USERS_PAGE_SIZE)
+        )
+        users = [user.id for user in response.body.data.users]
+        if users:
+            yield users
+        if len(users) < FILLING_USERS_PAGE_SIZE:
+            return
+        offset += FILLING_USERS_PAGE_SIZE
+
+
+def _review_rows(
+    users: Sequence[str], books: Sequence[str], reviewed: set[tuple[str, str]]
+) -> Iterator[dict]:
+    """
+    Generate random reviews of the users.
+
+    Notes:
+        Every user reviews distinct books, and the reviews of a user for a book are a history
+        in which only the last one is actual. Pairs in `reviewed` already have an actual review
+        and are skipped, so the one actual review per user and book rule holds.
+    """
+    for user_id in users:
+        if random.randint(0, 1) == 0:
+            continue
+        for book_id in random.sample(books, min(random.randint(1, 5), len(books))):
+            if (user_id, book_id) in reviewed:
+                continue
+            versions = 2 if random.randint(1, 10) > 8 else 1
+            for version in range(versions):
+                yield {
+                    "id": ulid(),
+                    "user_id": user_id,
+                    "book_id": book_id,
+                    "stars": random.randint(1, 5),
+                    "comment": fake.text(),
+                    "actual": version == versions - 1,
+                }
+
+
+async def _write_reviews(queue: Queue) -> int:
+    """Insert the chunks of reviews of the queue, one statement each, until a sentinel is taken."""
+    written = 0
+    async with get_session() as session:
+        while (rows := await queue.get()) is not None:
+            try:
+                await session.execute(insert(Review.__table__), rows)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+            written += len(rows)
+            await result_cache.invalidate(
+                {"review:*", "rating:*"}
+                | {f"review:user:{row['user_id']}" for row in rows}
+                | {f"review:book:{row['book_id']}" for row in rows}
             )
-            for user in users.body.data.users
-            if random.randint(0, 1) != 0
-            for _ in range(random.randint(1, 5))
-        ]
+    return written
 
-        await asyncio.gather(*tasks)
 
-    if session:
-        await body(session)
-    else:
-        async with get_session() as session:
-            await body(session)
+async def _put(queue: Queue, item: Any, writers: list[asyncio.Task]) -> None:
+    """
+    Put an item on a bounded queue, unless its writers have stopped.
 
+    Raises:
+        Exception: The error of a failed writer, instead of waiting forever for room in the queue.
+    """
+    put = asyncio.ensure_future(queue.put(item))
+    while True:
+        await asyncio.wait([put, *writers], return_when=asyncio.FIRST_COMPLETED)
+        if put.done():
+            return
+        for task in writers:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                put.cancel()
+                raise task.exception()  # type: ignore[misc]
+        if all(task.done() for task in writers):
+            put.cancel()
+            raise RuntimeError("the review writers stopped before the end of the queue")
+        writers = [task for task in writers if not task.done()]
+
+
+async def _filling_review(session: Optional[AsyncSession] = None, writers: int = FILLING_WRITERS) -> int:
+    """
+    Add random reviews of the users of the Users service to the books.
+
+    Args:
+        session (Optional[AsyncSession]): The session used for the reads and the rating rebuild.
+        writers (int): The number of concurrent writers, each with its own session.
+
+    Returns:
+        int: The number of inserted reviews.
+
+    Notes:
+        The users are read page by page and their reviews are inserted in chunks of
+        `FILLING_REVIEWS_BATCH_SIZE` rows. The queue between the generation and the writers holds
+        at most one chunk per writer, so memory use does not depend on the number of users.
+        The rating aggregates are rebuilt once all the reviews are written. A failed writer
+        stops the generation and its error is raised.
+    """
+
+    async def body(session: AsyncSession) -> int:
+        result = await session.execute(select(Book.id))
+        books = result.scalars().all()
+        if not books:
+            return 0
+        queue: Queue = Queue(maxsize=writers)
+        tasks = [asyncio.create_task(_write_reviews(queue)) for _ in range(writers)]
+        try:
+            chunk: list[dict] = []
+            async for users in _user_pages():
+                result = await session.execute(
+                    select(Review.user_id, Review.book_id).where(
+                        Review.actual.is_(True), Review.user_id.in_(users)
+                    )
+                )
+                reviewed = set(result.tuples().all())
+                for row in _review_rows(users, books, reviewed):
+                    chunk.append(row)
+                    if len(chunk) >= FILLING_REVIEWS_BATCH_SIZE:
+                        await _put(queue, chunk, tasks)
+                        chunk = []
+            if chunk:
+                await _put(queue, chunk, tasks)
+            for _ in tasks:
+                await _put(queue, None, tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        written = sum(await asyncio.gather(*tasks))
+        await rebuild_rating_stats(session)
+        logger.info(f"{written} reviews added")
+        return written
 
-async def filling_db(queries: Sequence[str], session: Optional[AsyncSession] = None):
+    if session:
+        return await body(session)
+    async with get_session() as session:
+        return await body(session)
+
+
+async def filling_db(
+    queries: Sequence[str],
+    session: Optional[AsyncSession] = None,
+    writers: int = FILLING_WRITERS,
+    terms: Optional[dict[str, TermStats]] = None,
+) -> list[WriterStats]:
+    """
+    Fetch the volumes matching the search terms and write them to the database.
+
+    Args:
+        queries (Sequence[str]): The search terms.
+        session (Optional[AsyncSession]): A session to write with; a single writer is then used.
+        writers (int): The number of concurrent writers, each with its own session.
+        terms (Optional[dict[str, TermStats]]): Filled with the outcome of every search term, if given.
+
+    Returns:
+        list[WriterStats]: The throughput of every writer.
+
+    Notes:
+        A book found by several search terms counts as inserted by each of them. If a search
+        term or a writer fails, or the filling is cancelled, the other requests and the writers
+        are cancelled and awaited before the error is raised.
+    """
     queue = Queue()
-    tasks = [_process_query(query, queue) for query in queries]
-    db_task = asyncio.create_task(_add_books_to_db(queue, session))
+    writers = 1 if session else max(writers, 1)
+    tasks = [
+        asyncio.create_task(
+            _process_query(query, queue, None if terms is None else terms.setdefault(query, TermStats()))
+        )
+        for query in queries
+    ]
+    db_tasks = [asyncio.create_task(_add_books_to_db(queue, worker, session)) for worker in range(writers)]
 
-    await asyncio.gather(*tasks)
-    await queue.put(None)  # the requests are finished
-    await db_task
+    try:
+        found = await asyncio.gather(*tasks)
+        for _ in db_tasks:
+            await queue.put(None)  # the requests are finished, one sentinel per writer
+        stats = await asyncio.gather(*db_tasks)
+    except BaseException:
+        for task in [*tasks, *db_tasks]:
+            task.cancel()
+        await asyncio.gather(*tasks, *db_tasks, return_exceptions=True)
+        raise
+    if terms is not None:
+        inserted_ids = set().union(*(writer.google_ids for writer in stats))
+        for query, google_ids in zip(queries, found, strict=True):
+            terms[query].books_inserted = len(google_ids & inserted_ids)
+    inserted = sum(writer.books_inserted for writer in stats)
+    elapsed = max((writer.elapsed for writer in stats), default=0.0)
+    logger.info(
+        f"{len(stats)} writers inserted {inserted} books in {elapsed:.1f}s "
+        f"({inserted / elapsed if elapsed else 0:.1f} books/s)"
+    )
+    return stats
 
 
 async def main(queries: Sequence, filling_review: bool = False):
-    if filling_review:
-        await _filling_review()
-    await filling_db(queries)
-    await _adding_books_by_authors()
-    await _adding_books_by_categories()
+    try:
+        if filling_review:
+            await _filling_review()
+        await filling_db(queries)
+        await _adding_books_by_authors()
+        await _adding_books_by_categories()
+    finally:
+        await google_books.aclose()
 
 
 if __name__ == "__main__":
@@ -187,7 +558,7 @@ if __name__ == "__main__":
     from db.models import *  # noqa: F401, F403
 
     if len(sys.argv) > 1:
-        filling_review = sys.argv[1].lower() == 'filling_review'
+        filling_review = sys.argv[1].lower() == "filling_review"
     else:
         filling_review = False
 
@@ -0,0 +1,20 @@
+import asyncio
+
+from config import logger
+from db.base import get_session
+from db.ratings import rebuild_rating_stats
+
+
+async def main():
+    async with get_session() as session:
+        books = await rebuild_rating_stats(session)
+    logger.info(f"rating aggregates rebuilt for {books} books")
+
+
+if __name__ == "__main__":
+    from db.base import _db_init
+    from db.models import *  # noqa: F401, F403
+
+    _db_init()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main())
@@ -0,0 +1,241 @@
+"""
+Dumps the catalog to a snapshot directory and restores it, to set up an environment without crawling.
+
+A snapshot holds the books, authors, categories, their associations and the reviews. Every table
+is written in chunks of gzip-compressed JSON lines, one array of column values per row, in
+primary key order. `manifest.json` records the format version, the columns of every table and
+the row count and SHA-256 checksum of every chunk. The dump reads all the tables in one
+repeatable-read transaction, so the snapshot is consistent.
+
+The restore checks every checksum before writing anything, then creates the tables without their
+secondary indexes and loads them in parallel, one connection per table, with `db.bulk.copy_rows`:
+COPY on PostgreSQL (asyncpg) and batched inserts elsewhere. Tables are loaded by dependency
+level, so the foreign keys hold: the books, authors and categories first, then the associations
+and the reviews. The indexes are built once the data is loaded, then the rating aggregates are
+rebuilt.
+
+The restore expects a database without the catalog tables, unless `--replace` is given to drop
+them with the rating aggregates; the other tables, such as the crawl state, are kept.
+
+Usage:
+    python app/_snapshot.py dump snapshots/catalog [--chunk-rows 100000]
+    python app/_snapshot.py load snapshots/catalog [--jobs 6] [--replace]
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from config import logger
+from db.base import Base, engine
+from db.bulk import copy_rows
+from db.models import Author, Book, BookRatingStats, Category, Review, book_authors, book_categories
+from db.ratings import rebuild_rating_stats
+from sqlalchemy import Table, func, inspect, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.schema import CreateTable
+
+FORMAT = 1
+TABLES: list[Table] = [
+    Category.__table__,  # type: ignore[list-item]
+    Author.__table__,  # type: ignore[list-item]
+    Book.__table__,  # type: ignore[list-item]
+    book_authors,
+    book_categories,
+    Review.__table__,  # type: ignore[list-item]
+]
+MANIFEST = "manifest.json"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_chunk(path: str, rows: list) -> str:
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as file:
+        for row in rows:
+            file.write(json.dumps(list(row), ensure_ascii=False, separators=(",", ":")))
+            file.write("\n")
+    return _sha256(path)
+
+
+def _read_chunk(path: str) -> list[list]:
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+async def dump(directory: str, chunk_rows: int) -> dict:
+    """
+    Write a snapshot of the catalog.
+
+    Args:
+        directory (str): The snapshot directory, created if needed; it should be empty.
+        chunk_rows (int): The number of rows per chunk file.
+
+    Returns:
+        dict: The manifest of the snapshot.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest: dict = {
+        "format": FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "tables": {},
+    }
+    options = {"isolation_level": "REPEATABLE READ"} if engine.dialect.name == "postgresql" else {}
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(**options)
+        async with conn.begin():
+            for table in TABLES:
+                columns = [column.name for column in table.columns]
+                chunks = []
+                result = await conn.stream(
+                    select(table).order_by(*table.primary_key.columns).execution_options(yield_per=chunk_rows)
+                )
+                async for rows in result.partitions():
+                    name = f"{table.name}-{len(chunks):05d}.jsonl.gz"
+                    checksum = await asyncio.to_thread(_write_chunk, os.path.join(directory, name), rows)
+                    chunks.append({"file": name, "rows": len(rows), "sha256": checksum})
+                manifest["tables"][table.name] = {
+                    "columns": columns,
+                    "rows": sum(chunk["rows"] for chunk in chunks),
+                    "chunks": chunks,
+                }
+                logger.info(f"{table.name}: {manifest['tables'][table.name]['rows']} rows dumped")
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def _read_manifest(directory: str) -> dict:
+    """Read the manifest of a snapshot and check its format, its tables and every chunk checksum."""
+    with open(os.path.join(directory, MANIFEST), encoding="utf-8") as file:
+        manifest = json.load(file)
+    if manifest.get("format") != FORMAT:
+        raise ValueError(f"unsupported snapshot format {manifest.get('format')}, expected {FORMAT}")
+    for table in TABLES:
+        entry = manifest["tables"].get(table.name)
+        if entry is None:
+            raise ValueError(f"the snapshot has no {table.name} table")
+        if unknown := set(entry["columns"]) - set(table.columns.keys()):
+            raise ValueError(f"the {table.name} table of the snapshot has unknown columns {sorted(unknown)}")
+        for chunk in entry["chunks"]:
+            if _sha256(os.path.join(directory, chunk["file"])) != chunk["sha256"]:
+                raise ValueError(f"the checksum of {chunk['file']} does not match the manifest")
+    return manifest
+
+
+def _levels() -> list[list[Table]]:
+    """Group the tables so that every table comes after the tables its foreign keys reference."""
+    level: dict[str, int] = {}
+    for table in TABLES:  # TABLES lists the referenced tables first
+        parents = [key.column.table.name for key in table.foreign_keys if key.column.table in TABLES]
+        level[table.name] = 1 + max((level[parent] for parent in parents), default=-1)
+    return [
+        [table for table in TABLES if level[table.name] == depth] for depth in range(max(level.values()) + 1)
+    ]
+
+
+async def _load_table(directory: str, table: Table, entry: dict, jobs: asyncio.Semaphore) -> None:
+    async with jobs, engine.begin() as conn:
+        started = time.perf_counter()
+        for chunk in entry["chunks"]:
+            rows = await asyncio.to_thread(_read_chunk, os.path.join(directory, chunk["file"]))
+            await copy_rows(conn, table, [dict(zip(entry["columns"], row, strict=True)) for row in rows])
+        logger.info(f"{table.name}: {entry['rows']} rows loaded in {time.perf_counter() - started:.1f}s")
+
+
+async def _create_indexes(table: Table, jobs: asyncio.Semaphore) -> None:
+    async with jobs, engine.begin() as conn:
+        for index in table.indexes:
+            await conn.run_sync(index.create)
+
+
+async def _check_counts(conn: AsyncConnection, manifest: dict) -> None:
+    for table in TABLES:
+        count = await conn.scalar(select(func.count()).select_from(table))
+        if count != manifest["tables"][table.name]["rows"]:
+            raise ValueError(
+                f"{table.name} holds {count} rows, the snapshot {manifest['tables'][table.name]['rows']}"
+            )
+
+
+async def load(directory: str, jobs: int, replace: bool = False) -> dict:
+    """
+    Restore a snapshot of the catalog.
+
+    Args:
+        directory (str): The snapshot directory.
+        jobs (int): The maximum number of tables loaded or indexed at the same time.
+        replace (bool): Whether to drop the existing catalog tables and rating aggregates first.
+
+    Returns:
+        dict: The manifest of the restored snapshot.
+
+    Raises:
+        ValueError: If the snapshot is invalid or the catalog tables already exist.
+    """
+    manifest = await asyncio.to_thread(_read_manifest, directory)
+    others = [table for table in Base.metadata.sorted_tables if table not in TABLES]
+    async with engine.begin() as conn:
+        existing = set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+        if existing & {table.name for table in TABLES}:
+            if not replace:
+                raise ValueError("the catalog tables already exist; restore with --replace to drop them")
+            await conn.run_sync(Base.metadata.drop_all, tables=[BookRatingStats.__table__, *TABLES])
+        for table in TABLES:
+            await conn.execute(CreateTable(table))
+        await conn.run_sync(Base.metadata.create_all, tables=others)
+
+    semaphore = asyncio.Semaphore(jobs)
+    for level in _levels():
+        await asyncio.gather(
+            *(_load_table(directory, table, manifest["tables"][table.name], semaphore) for table in level)
+        )
+    started = time.perf_counter()
+    await asyncio.gather(*(_create_indexes(table, semaphore) for table in TABLES))
+    logger.info(f"indexes created in {time.perf_counter() - started:.1f}s")
+
+    async with engine.connect() as conn:
+        await _check_counts(conn, manifest)
+    async with AsyncSession(engine) as session:
+        await rebuild_rating_stats(session)
+    return manifest
+
+
+async def main(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    if args.command == "dump":
+        manifest = await dump(args.directory, args.chunk_rows)
+    else:
+        manifest = await load(args.directory, args.jobs, args.replace)
+    rows = {name: entry["rows"] for name, entry in manifest["tables"].items()}
+    logger.info(
+        f"snapshot {args.command} of {args.directory} done in {time.perf_counter() - started:.1f}s: {rows}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dump the catalog to a snapshot or restore it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dump_parser = commands.add_parser("dump", help="write a snapshot of the catalog")
+    dump_parser.add_argument("directory")
+    dump_parser.add_argument("--chunk-rows", type=int, default=100000)
+    load_parser = commands.add_parser("load", help="restore a snapshot into the database")
+    load_parser.add_argument("directory")
+    load_parser.add_argument("--jobs", type=int, default=len(TABLES), help="tables loaded in parallel")
+    load_parser.add_argument("--replace", action="store_true", help="drop the existing catalog tables")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    except ValueError as e:
+        sys.exit(str(e))
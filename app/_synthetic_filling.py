@@ -0,0 +1,287 @@
+"""
+Fills the database with a synthetic catalog, offline and reproducibly.
+
+Books, authors, categories, their associations and reviews are generated from a seed, so the
+same arguments always produce the same rows. Popularity is skewed like in a real catalog: a few
+authors write most of the books (Zipf's law) and a few books receive most of the reviews.
+Rows are generated and written in chunks, so memory use does not depend on the dataset size.
+On PostgreSQL every chunk is streamed with COPY through the asyncpg connection; other databases
+get batched multi-row inserts. The rating aggregates are rebuilt at the end.
+
+Ids are ULIDs like those of the service: their time prefix grows with the position of the row,
+one `ID_INTERVAL_MS` apart from `ID_EPOCH_MS`, so rows are written in index order and the books
+keep the creation order the export relies on; only their 80 random bits come from the seed.
+
+The database is expected to hold no synthetic rows generated with the same seed.
+
+Usage:
+    python app/_synthetic_filling.py --books 1000000 --reviews 10000000 [--seed 0]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+from config import logger
+from db.base import Base, engine
+from db.bulk import copy_rows
+from db.models import Author, Book, Category, Review, book_authors, book_categories
+from db.ratings import rebuild_rating_stats
+from faker import Faker
+from sqlalchemy.ext.asyncio import AsyncSession
+from ulid import ULID
+
+CHUNK_SIZE = 20000
+CATEGORIES = 300
+LANGUAGES = ["en"] * 12 + ["ru"] * 3 + ["de", "fr", "es", "it", "ja", "pt"]
+PUBLISHERS = 2000
+STARS = range(1, 6)
+STARS_CUMULATIVE_WEIGHTS = (4, 10, 24, 58, 100)
+ID_EPOCH_MS = 1577836800000  # 2020-01-01T00:00:00Z, the creation time of the first row
+ID_INTERVAL_MS = 1000
+
+
+@dataclass
+class Scale:
+    """The size of a synthetic dataset; the counts of authors and users derive from the books."""
+
+    books: int
+    reviews: int
+    seed: int = 0
+    zipf: float = 1.1
+    reviews_zipf: float = 0.8
+
+    @property
+    def authors(self) -> int:
+        return max(self.books // 4, 1)
+
+    @property
+    def users(self) -> int:
+        return max(self.reviews // 8, 1)
+
+
+def _zipf_rank(rng: random.Random, n: int, s: float) -> int:
+    """Draw a rank in [0, n) with a probability decreasing as a power `s` of the rank, in O(1)."""
+    u = rng.random()
+    if s == 1:
+        return min(int(n**u) - 1, n - 1)
+    return min(int(((n ** (1 - s) - 1) * u + 1) ** (1 / (1 - s))) - 1, n - 1)
+
+
+def _zipf_weight_sum(n: int, s: float) -> float:
+    if s == 1:
+        return math.log(n) + 0.5772
+    return (n ** (1 - s) - 1) / (1 - s) + 0.5 * (1 + n**-s)
+
+
+def _ulid(scale: Scale, kind: str, position: int) -> str:
+    """Build a ULID created `position` intervals after the epoch, with randomness derived from the seed."""
+    milliseconds = ID_EPOCH_MS + position * ID_INTERVAL_MS
+    randomness = hashlib.blake2b(f"{scale.seed}:{kind}:{position}".encode(), digest_size=10).digest()
+    return str(ULID.from_bytes(milliseconds.to_bytes(6, "big") + randomness))
+
+
+def book_id(scale: Scale, position: int) -> str:
+    return _ulid(scale, "book", position)
+
+
+def review_id(scale: Scale, position: int) -> str:
+    return _ulid(scale, "review", position)
+
+
+def user_id(scale: Scale, position: int) -> str:
+    return f"synthetic-user-{scale.seed}-{position}"
+
+
+class Catalog:
+    """
+    Deterministic generator of the rows of a synthetic dataset.
+
+    Args:
+        scale (Scale): The size and the seed of the dataset.
+
+    Notes:
+        The popularity rank of an author is mapped to its position by a multiplication modulo
+        the number of authors, so the most prolific ones do not share their last name.
+        Faker provides the vocabulary: names, publishers, categories and words. Texts are then
+        assembled from it with a seeded `random.Random`, which is an order of magnitude faster
+        than a Faker call per field. Author names are derived from their position by combining
+        first names, last names and middle initials, so they are unique without remembering the
+        names already generated.
+    """
+
+    def __init__(self, scale: Scale) -> None:
+        self.scale = scale
+        self.fake = Faker()
+        self.fake.seed_instance(scale.seed)
+        self.rng = random.Random(scale.seed)
+        provider = self.fake.provider("faker.providers.person")
+        self._first_names = sorted(set(provider.first_names))  # type: ignore[union-attr]
+        self._last_names = sorted(set(provider.last_names))  # type: ignore[union-attr]
+        self.categories = sorted({self.fake.unique.catch_phrase().title() for _ in range(CATEGORIES)})
+        self.publishers = [self.fake.company() for _ in range(PUBLISHERS)]
+        self._words = list(self.fake.get_words_list())
+        self._author_step = 7919
+        while math.gcd(self._author_step, scale.authors) != 1:
+            self._author_step += 2
+
+    def text(self, words: int) -> str:
+        return " ".join(self.rng.choices(self._words, k=words)).capitalize()
+
+    def paragraph(self, sentences: int) -> str:
+        return " ".join(f"{self.text(self.rng.randint(6, 16))}." for _ in range(sentences))
+
+    def author_name(self, position: int) -> str:
+        first, rest = position % len(self._first_names), position // len(self._first_names)
+        last, rest = rest % len(self._last_names), rest // len(self._last_names)
+        name = f"{self._first_names[first]} {self._last_names[last]}"
+        if rest:
+            name = f"{self._first_names[first]} {chr(ord('A') + (rest - 1) % 26)}. {self._last_names[last]}"
+            if rest > 26:
+                name = f"{name} {(rest - 1) // 26 + 1}"
+        return name
+
+    def authors(self) -> Iterator[list[dict]]:
+        for start in range(0, self.scale.authors, CHUNK_SIZE):
+            yield [
+                {"name": self.author_name(p)}
+                for p in range(start, min(start + CHUNK_SIZE, self.scale.authors))
+            ]
+
+    def books(self) -> Iterator[tuple[list[dict], list[dict], list[dict]]]:
+        """Yield the books of a chunk with their author and category associations."""
+        rng, scale = self.rng, self.scale
+        for start in range(0, scale.books, CHUNK_SIZE):
+            books, authors, categories = [], [], []
+            for position in range(start, min(start + CHUNK_SIZE, scale.books)):
+                identifier = book_id(scale, position)
+                published = f"{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+                books.append(
+                    {
+                        "id": identifier,
+                        "google_id": f"synthetic-{identifier}",
+                        "title": self.text(rng.randint(1, 6)),
+                        "publisher": rng.choice(self.publishers),
+                        "publishedDate": published,
+                        "description": self.paragraph(rng.randint(2, 8)),
+                        "pageCount": int(rng.lognormvariate(5.6, 0.5)),
+                        "maturityRating": "MATURE" if rng.random() < 0.03 else "NOT_MATURE",
+                        "smallThumbnail": None,
+                        "thumbnail": None,
+                        "language": rng.choice(LANGUAGES),
+                    }
+                )
+                for rank in {
+                    _zipf_rank(rng, scale.authors, scale.zipf) for _ in range(rng.choice((1, 1, 1, 2, 3)))
+                }:
+                    author = self.author_name(rank * self._author_step % scale.authors)
+                    authors.append({"book_id": identifier, "author_name": author})
+                for category in set(rng.choices(self.categories, k=rng.randint(1, 3))):
+                    categories.append({"book_id": identifier, "category_name": category})
+            yield books, authors, categories
+
+    def reviews(self) -> Iterator[list[dict]]:
+        """
+        Yield the reviews in chunks, book by book.
+
+        Notes:
+            The number of reviews of a book follows its Zipf weight, scaled to the requested
+            total. The reviewers of a book are an arithmetic progression modulo the number of
+            users with a step coprime to it, so they are distinct without being remembered and
+            every user has at most one actual review per book; some of them also have an older,
+            no longer actual one.
+        """
+        rng, scale = self.rng, self.scale
+        norm = scale.reviews / _zipf_weight_sum(scale.books, scale.reviews_zipf)
+        chunk: list[dict] = []
+        position = 0
+        for book in range(scale.books):
+            if position >= scale.reviews:
+                break
+            expected = norm / (book + 1) ** scale.reviews_zipf
+            count = min(int(expected) + (rng.random() < expected % 1), scale.users, scale.reviews - position)
+            first, step = rng.randrange(scale.users), rng.randrange(1, scale.users + 1)
+            while math.gcd(step, scale.users) != 1:
+                step += 1
+            identifier = book_id(scale, book)
+            for reviewer in ((first + k * step) % scale.users for k in range(count)):
+                versions = 2 if rng.random() < 0.1 and position + 1 < scale.reviews else 1
+                for version in range(versions):
+                    chunk.append(
+                        {
+                            "id": review_id(scale, position),
+                            "user_id": user_id(scale, reviewer),
+                            "book_id": identifier,
+                            "stars": rng.choices(STARS, cum_weights=STARS_CUMULATIVE_WEIGHTS)[0],
+                            "comment": f"{self.text(rng.randint(4, 30))}." if rng.random() < 0.7 else None,
+                            "actual": version == versions - 1,
+                        }
+                    )
+                    position += 1
+                if len(chunk) >= CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+async def generate(scale: Scale) -> dict[str, int]:
+    """
+    Write a synthetic dataset, chunk by chunk.
+
+    Args:
+        scale (Scale): The size and the seed of the dataset.
+
+    Returns:
+        dict[str, int]: The number of written rows per table.
+    """
+    catalog = Catalog(scale)
+    written = {
+        table: 0 for table in ("categories", "authors", "books", "book_authors", "book_categories", "review")
+    }
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        category_rows = [{"name": name} for name in catalog.categories]
+        await copy_rows(conn, Category.__table__, category_rows)  # type: ignore[arg-type]
+        written["categories"] = len(catalog.categories)
+        for rows in catalog.authors():
+            await copy_rows(conn, Author.__table__, rows)  # type: ignore[arg-type]
+            written["authors"] += len(rows)
+        for books, authors, categories in catalog.books():
+            await copy_rows(conn, Book.__table__, books)  # type: ignore[arg-type]
+            await copy_rows(conn, book_authors, authors)
+            await copy_rows(conn, book_categories, categories)
+            written["books"] += len(books)
+            written["book_authors"] += len(authors)
+            written["book_categories"] += len(categories)
+        for rows in catalog.reviews():
+            await copy_rows(conn, Review.__table__, rows)  # type: ignore[arg-type]
+            written["review"] += len(rows)
+    async with AsyncSession(engine) as session:
+        await rebuild_rating_stats(session)
+    return written
+
+
+async def main(scale: Scale) -> None:
+    started = time.perf_counter()
+    written = await generate(scale)
+    elapsed = time.perf_counter() - started
+    rows = sum(written.values())
+    logger.info(
+        f"synthetic catalog written in {elapsed:.1f}s ({rows / elapsed * 60:.0f} rows/min): {written}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the database with a synthetic catalog.")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--reviews", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zipf", type=float, default=1.1, help="the skew of the author and book popularity")
+    args = parser.parse_args()
+    asyncio.run(main(Scale(args.books, args.reviews, args.seed, args.zipf)))
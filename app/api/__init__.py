@@ -1,3 +1,39 @@
+from datetime import datetime
+from typing import Optional
+
+from api.export import export_lines, gzip_chunks
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from metrics import registry
 
 router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Expose the service metrics in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/export/books")
+async def export_books(
+    updated_since: Optional[datetime] = None,
+    after: Optional[str] = None,
+    reviews: bool = False,
+    gzip: bool = False,
+) -> StreamingResponse:
+    """
+    Stream the books with their authors and categories as NDJSON, one book per line, in id order.
+
+    Args:
+        updated_since (Optional[datetime]): Only export the books added since this date.
+        after (Optional[str]): Only export the books after this id, to resume an export.
+        reviews (bool): Whether to include the actual reviews of every book.
+        gzip (bool): Whether to gzip the stream, sent with `Content-Encoding: gzip`.
+    """
+    lines = export_lines(updated_since, after, reviews)
+    if gzip:
+        return StreamingResponse(
+            gzip_chunks(lines), media_type="application/x-ndjson", headers={"Content-Encoding": "gzip"}
+        )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
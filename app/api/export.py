@@ -0,0 +1,92 @@
+"""
+This module streams the catalog for the services that need all of it, such as search indexing.
+
+Books are read through a server-side cursor in batches of `EXPORT_BATCH_SIZE`, their authors and
+categories, and optionally their actual reviews, being loaded with one `IN (...)` query per
+batch. Each book is written as one JSON line, optionally gzip-compressed, as soon as its batch is
+read, so the memory used does not depend on the size of the catalog.
+
+Books are never updated once ingested, and their ULID ids start with their creation time, so
+the books added since a date are those whose id is above the smallest ULID of that date.
+
+Functions:
+    export_lines: Yields the exported books as NDJSON chunks.
+    gzip_chunks: Compresses a stream of chunks into a gzip stream.
+"""
+
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+import config
+from db.models import Book, Review
+from db.replicas import get_read_session
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+from ulid import ULID
+
+_COLUMNS = [column.key for column in Book.__table__.columns]
+
+
+def _ulid_floor(since: datetime) -> str:
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    milliseconds = int(since.timestamp() * 1000)
+    return str(ULID.from_bytes(milliseconds.to_bytes(6, "big") + bytes(10)))
+
+
+def _book_line(book: Book, reviews: bool) -> str:
+    row = {column: getattr(book, column) for column in _COLUMNS}
+    row["authors"] = [author.name for author in book.authors]
+    row["categories"] = [category.name for category in book.categories]
+    if reviews:
+        row["reviews"] = [
+            {"id": review.id, "user_id": review.user_id, "stars": review.stars, "comment": review.comment}
+            for review in book.reviews
+        ]
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+async def export_lines(
+    updated_since: Optional[datetime] = None, after: Optional[str] = None, reviews: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Yield the books of the catalog as NDJSON, one chunk per batch, in id order.
+
+    Args:
+        updated_since (Optional[datetime]): Only export the books added since this date; a
+            naive date is taken as UTC.
+        after (Optional[str]): Only export the books whose id is above this one, the last id
+            of an interrupted export.
+        reviews (bool): Whether to include the actual reviews of every book.
+
+    Yields:
+        bytes: The lines of a batch of books.
+
+    Notes:
+        The session is opened here, so it lives as long as the response is being sent. The
+        identity map holds the books weakly, so each batch is released once written.
+    """
+    options = [selectinload(Book.authors), selectinload(Book.categories)]
+    if reviews:
+        options.append(selectinload(Book.reviews.and_(Review.actual.is_(True))))
+    stmt = select(Book).options(*options).order_by(Book.id)
+    if updated_since is not None:
+        stmt = stmt.where(Book.id >= _ulid_floor(updated_since))
+    if after is not None:
+        stmt = stmt.where(Book.id > after)
+
+    async with get_read_session() as session:
+        result = await session.stream(stmt.execution_options(yield_per=config.EXPORT_BATCH_SIZE))
+        async for books in result.scalars().partitions():
+            yield "".join(_book_line(book, reviews) for book in books).encode()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a stream of chunks into a single gzip stream, yielding as each chunk is compressed."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
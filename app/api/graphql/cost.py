@@ -0,0 +1,186 @@
+"""
+This module contains the cost analysis of GraphQL operations, run before they are executed.
+
+The cost of an operation estimates the number of objects it resolves. A list field multiplies
+the cost of its selection by its expected size: the `limit` or `first` argument, bounded by the
+number of `ids` or `names` asked for, for the root fields, and a per-relationship estimate for
+the nested ones. Operations deeper than
+`QUERY_MAX_DEPTH` or costing more than the budget of the calling service are rejected before a
+database session is opened. The `limit` arguments are clamped to `QUERY_MAX_LIMIT` by the
+resolvers, so the estimate is an upper bound of what the operation can load.
+
+Classes:
+    QueryCost: The cost and the depth of an operation.
+
+Functions:
+    analyze: Computes the cost of an operation.
+    budget: Returns the cost budget of a service.
+    clamp_limit: Applies `QUERY_MAX_LIMIT` to a `limit` argument.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import config
+from api.graphql.pagination import DEFAULT_PAGE_SIZE
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLList,
+    GraphQLNonNull,
+    GraphQLObjectType,
+    GraphQLSchema,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    OperationType,
+    SelectionSetNode,
+    Undefined,
+    value_from_ast,
+)
+
+DEFAULT_LIMIT = 10  # the default `limit` of the resolvers
+NESTED_LIST_SIZES = {
+    ("Book", "authors"): 2,
+    ("Book", "categories"): 2,
+    ("Author", "books"): 20,
+    ("Category", "books"): 1000,
+}
+SIZE_ARGUMENTS = ("limit", "first")
+KEY_ARGUMENTS = ("ids", "names", "google_ids")
+
+
+@dataclass
+class QueryCost:
+    """The estimated number of resolved objects and the nesting depth of an operation."""
+
+    cost: int = 0
+    depth: int = 0
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Return the `limit` argument capped to `QUERY_MAX_LIMIT`; no limit means the maximum."""
+    return config.QUERY_MAX_LIMIT if limit is None else min(limit, config.QUERY_MAX_LIMIT)
+
+
+def budget(service: Optional[str]) -> int:
+    """Return the cost budget of a service, `QUERY_COST_BUDGET` unless configured otherwise."""
+    return config.QUERY_COST_BUDGETS.get(service or "", config.QUERY_COST_BUDGET)
+
+
+def _unwrap(type_: Any) -> tuple[Any, bool]:
+    is_list = False
+    while isinstance(type_, (GraphQLNonNull, GraphQLList)):
+        is_list |= isinstance(type_, GraphQLList)
+        type_ = type_.of_type
+    return type_, is_list
+
+
+def _arguments(node: FieldNode, field: Any, variables: dict) -> dict[str, Any]:
+    arguments = {}
+    for argument in node.arguments or ():
+        if (definition := field.args.get(argument.name.value)) is not None:
+            value = value_from_ast(argument.value, definition.type, variables)
+            if value is not Undefined:
+                arguments[argument.name.value] = value
+    return arguments
+
+
+def _size(parent: str, name: str, arguments: dict[str, Any], root: bool) -> int:
+    size: Optional[int] = None
+    for argument in SIZE_ARGUMENTS:
+        if argument in arguments:
+            if argument == "first" and arguments[argument] is None:
+                size = DEFAULT_PAGE_SIZE  # a null page size means the default one
+            else:
+                size = clamp_limit(arguments[argument])
+            break
+    else:
+        if root:
+            size = DEFAULT_LIMIT
+    for argument in KEY_ARGUMENTS:
+        if isinstance(keys := arguments.get(argument), list):
+            size = len(keys) if size is None else min(size, len(keys))
+    if size is None:
+        return NESTED_LIST_SIZES.get((parent, name), config.QUERY_NESTED_LIST_SIZE)
+    return size
+
+
+class _Analyzer:
+    def __init__(self, schema: GraphQLSchema, fragments: dict, variables: dict) -> None:
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables
+
+    def fields(
+        self, selection_set: Optional[SelectionSetNode], spread: frozenset = frozenset()
+    ) -> list[FieldNode]:
+        if selection_set is None:
+            return []
+        fields = []
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                fields.extend(self.fields(selection.selection_set, spread))
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name in self.fragments and name not in spread:  # cycles are left to the validation
+                    fields.extend(self.fields(self.fragments[name].selection_set, spread | {name}))
+        return fields
+
+    def cost(
+        self, parent: GraphQLObjectType, selection_set: SelectionSetNode, pending: Optional[int], depth: int
+    ) -> QueryCost:
+        """
+        Return the cost of one object of `parent` and the depth below it.
+
+        Notes:
+            `pending` is the size given by the arguments of a connection field, which applies
+            to the first list below it.
+        """
+        total = QueryCost(depth=depth)
+        for node in self.fields(selection_set):
+            field = parent.fields.get(node.name.value)
+            if field is None:
+                continue
+            type_, is_list = _unwrap(field.type)
+            if not isinstance(type_, GraphQLObjectType):
+                continue
+            arguments = _arguments(node, field, self.variables)
+            root = parent in (self.schema.query_type, self.schema.mutation_type)
+            size = 1
+            nested_pending = None
+            if is_list:
+                size = (
+                    pending if pending is not None else _size(parent.name, node.name.value, arguments, root)
+                )
+            elif any(argument in arguments for argument in SIZE_ARGUMENTS) or root:
+                nested_pending = _size(parent.name, node.name.value, arguments, root)
+            below = self.cost(type_, node.selection_set, nested_pending, depth + 1)
+            total.cost += size * (1 + below.cost)
+            total.depth = max(total.depth, below.depth)
+        return total
+
+
+def analyze(
+    schema: GraphQLSchema, operation: OperationDefinitionNode, fragments: dict, variables: Optional[dict]
+) -> QueryCost:
+    """
+    Compute the cost of an operation.
+
+    Args:
+        schema (GraphQLSchema): The executed schema.
+        operation (OperationDefinitionNode): The operation of the request.
+        fragments (dict): The fragment definitions of the document, by name.
+        variables (Optional[dict]): The variables of the request.
+
+    Returns:
+        QueryCost: The estimated number of resolved objects and the nesting depth.
+
+    Notes:
+        Fields unknown to the schema are ignored, as validation rejects them afterwards.
+    """
+    root = schema.mutation_type if operation.operation == OperationType.MUTATION else schema.query_type
+    if root is None:
+        return QueryCost()
+    return _Analyzer(schema, fragments, variables or {}).cost(root, operation.selection_set, None, 0)
@@ -4,14 +4,21 @@ This module contains functions and decorators for verifying service and client t
 It integrates OpenTelemetry tracing and handles errors related
 to invalid or missing tokens.
 
+Classes:
+    VerifiedTokenCache: A bounded cache of verified token payloads, valid until the token expires.
+
 Functions:
     verify_service_token: Verifies the service token from the request headers.
     verify_client_token: Verifies the client token from the request headers.
     verify_tokens_decorator: A decorator to verify service and client tokens for GraphQL resolvers.
 """
 
+import hashlib
 import inspect
+import time
+from collections import OrderedDict
 from functools import wraps
+from typing import Any, Optional
 
 import config
 from fastapi.security import HTTPBearer
@@ -31,6 +38,63 @@ security = HTTPBearer()
 tracer = trace.get_tracer(__name__)
 
 
+class VerifiedTokenCache:
+    """
+    Cache of verified token payloads keyed by the token hash.
+
+    Args:
+        maxsize (int): The maximum number of payloads; the least recently used one is evicted first.
+        max_ttl (float): The maximum number of seconds a payload is trusted without verification.
+
+    Notes:
+        A payload is kept until the `exp` of its token, but never longer than `max_ttl`, so a
+        revocation on the authentication side is picked up within `max_ttl`. Only successfully
+        verified tokens are cached.
+    """
+
+    def __init__(self, maxsize: int, max_ttl: float) -> None:
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self._payloads: OrderedDict[bytes, tuple[float, Any]] = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Any]:
+        key = self._key(token)
+        entry = self._payloads.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._payloads[key]
+            return None
+        self._payloads.move_to_end(key)
+        return entry[1]
+
+    def set(self, token: str, payload: Any) -> None:
+        expires_at = time.time() + self.max_ttl
+        if (exp := getattr(payload, "exp", None)) is not None:
+            expires_at = min(expires_at, float(exp.timestamp() if hasattr(exp, "timestamp") else exp))
+        key = self._key(token)
+        self._payloads[key] = (expires_at, payload)
+        self._payloads.move_to_end(key)
+        while len(self._payloads) > self.maxsize:
+            self._payloads.popitem(last=False)
+
+    def revoke(self, token: str) -> None:
+        """Forget the payload of a token, forcing its next use to be verified again."""
+        self._payloads.pop(self._key(token), None)
+
+    def flush(self) -> None:
+        """Forget every payload."""
+        self._payloads.clear()
+
+
+service_token_cache = VerifiedTokenCache(config.TOKEN_CACHE_SIZE, config.TOKEN_CACHE_MAX_TTL)
+client_token_cache = VerifiedTokenCache(config.TOKEN_CACHE_SIZE, config.TOKEN_CACHE_MAX_TTL)
+
+
 @dep_opentelemetry_service_decorator(tracer)
 async def verify_service_token(context: GraphQLContext) -> ServiceAccessTokenPayload:
     """
@@ -47,6 +111,7 @@ async def verify_service_token(context: GraphQLContext) -> ServiceAccessTokenPay
 
     Notes:
         This function expects the token to be in the 'Authorization' header of the request.
+        Payloads of already verified tokens are taken from `service_token_cache`.
     """
     try:
         token_header = context.request.headers.get("Authorization")
@@ -56,10 +121,11 @@ async def verify_service_token(context: GraphQLContext) -> ServiceAccessTokenPay
                     error=ErrorCode.JWT_INVALID, extra="The server token is incorrect (missing or empty)"
                 )
             )
-        payload = await verify_service_token_dep(
-            self_service=config.SelfService,
-            access_token=config.SelfService.extract_token_from_header(token_header)[1:],
-        )
+        access_token = config.SelfService.extract_token_from_header(token_header)[1:]
+        if (payload := service_token_cache.get(access_token)) is not None:
+            return payload
+        payload = await verify_service_token_dep(self_service=config.SelfService, access_token=access_token)
+        service_token_cache.set(access_token, payload)
     except InvalidJWT as e:
         raise GraphQLError(
             message=str(e.error_schema.error),
@@ -86,6 +152,7 @@ async def verify_client_token(context: GraphQLContext) -> ClientAccessTokenPaylo
 
     Notes:
         This function expects the token to be in the 'X-Token-Client' header of the request.
+        Payloads of already verified tokens are taken from `client_token_cache`.
     """
     try:
         token = context.request.headers.get("X-Client-Token")
@@ -96,7 +163,10 @@ async def verify_client_token(context: GraphQLContext) -> ClientAccessTokenPaylo
                     extra="The server token is incorrect (missing or empty)",
                 )
             )
+        if (payload := client_token_cache.get(token)) is not None:
+            return payload
         payload = await verify_client_token_dep(self_service=config.SelfService, access_token=token)
+        client_token_cache.set(token, payload)
     except InvalidJWT as e:
         raise GraphQLError(
             message=str(e.error_schema.error),
@@ -121,16 +191,19 @@ def verify_tokens_decorator(func):
         This decorator checks the function signature for the presence of 'service_token' and
         'user_token' arguments and automatically verifies the corresponding tokens before calling
         the resolver. The verified tokens are passed to the resolver as arguments.
+        The signature is inspected once, when the resolver is decorated.
     """
+    func_signature_arguments = inspect.signature(func).parameters
+    needs_service_token = "service_token" in func_signature_arguments
+    needs_client_token = "client_token" in func_signature_arguments
 
     @wraps(func)
     async def wrapper(root, info: GraphQLResolveInfo, **kwargs):
-        func_signature_arguments = [param.name for param in inspect.signature(func).parameters.values()]
         func_kwargs = {}
-        if (service := "service_token") in func_signature_arguments:
-            func_kwargs[service] = await verify_service_token(info.context)
-        if (user := "client_token") in func_signature_arguments:
-            func_kwargs[user] = await verify_client_token(info.context)
+        if needs_service_token:
+            func_kwargs["service_token"] = await verify_service_token(info.context)
+        if needs_client_token:
+            func_kwargs["client_token"] = await verify_client_token(info.context)
         return await func(root, info, **func_kwargs, **kwargs)
 
     return wrapper
@@ -0,0 +1,159 @@
+"""
+This module contains the caching of parsed GraphQL documents and the persisted queries registry.
+
+Callers send a small fixed set of queries, so each query text is parsed and validated against
+the schema once and the resulting document is reused for later requests with the same text.
+Persisted queries let callers send only the SHA-256 hash of a known query instead of its text.
+
+Classes:
+    DocumentCache: An LRU cache of parsed and validated documents keyed by the query hash.
+    PersistedQueries: The registry of queries that can be referenced by their hash.
+
+Attributes:
+    document_cache: The document cache used by the GraphQL route.
+    persisted_queries: The persisted queries registry used by the GraphQL route.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Optional
+
+import config
+from graphql import DocumentNode, GraphQLError, GraphQLSchema, parse, validate
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class DocumentCache:
+    """
+    LRU cache of parsed documents that remembers which of them passed validation.
+
+    Args:
+        maxsize (int): The maximum number of cached documents.
+
+    Notes:
+        `parse` and `validate` implement the `query_parser` and `query_validator` hooks
+        of `ariadne.graphql`. Only documents without validation errors are remembered as
+        valid, so an invalid query is validated again each time it is sent.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.parsed = 0
+        self.parse_skipped = 0
+        self.validated = 0
+        self.validate_skipped = 0
+        self._documents: OrderedDict[str, DocumentNode] = OrderedDict()
+        self._valid: set[int] = set()
+
+    def parse(self, context_value: Any, data: dict) -> DocumentNode:
+        query: str = data["query"]
+        key = query_hash(query)
+        if (document := self._documents.get(key)) is not None:
+            self._documents.move_to_end(key)
+            self.parse_skipped += 1
+            return document
+        document = parse(query)
+        self.parsed += 1
+        self._documents[key] = document
+        while len(self._documents) > self.maxsize:
+            _, evicted = self._documents.popitem(last=False)
+            self._valid.discard(id(evicted))
+        return document
+
+    def validate(
+        self, schema: GraphQLSchema, document_ast: DocumentNode, *args, **kwargs
+    ) -> list[GraphQLError]:
+        if id(document_ast) in self._valid:
+            self.validate_skipped += 1
+            return []
+        errors = validate(schema, document_ast, *args, **kwargs)
+        self.validated += 1
+        if not errors and any(document is document_ast for document in self._documents.values()):
+            self._valid.add(id(document_ast))
+        return errors
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._documents),
+            "parsed": self.parsed,
+            "parseSkipped": self.parse_skipped,
+            "validated": self.validated,
+            "validateSkipped": self.validate_skipped,
+        }
+
+
+class PersistedQueries:
+    """
+    Registry of queries referenced by the SHA-256 hash of their text.
+
+    Args:
+        maxsize (int): The maximum number of queries registered by callers at runtime.
+
+    Notes:
+        Requests follow the automatic persisted queries convention: the hash is sent in
+        `extensions.persistedQuery.sha256Hash`. A request with the hash and the query registers
+        the query; a request with the hash only is served from the registry.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._preloaded: dict[str, str] = {}
+        self._registered: dict[str, str] = {}
+
+    def load(self, path: str) -> int:
+        """
+        Preload queries from a JSON file.
+
+        Args:
+            path (str): A JSON file holding either a list of queries or an object mapping
+                the hashes to the queries.
+
+        Returns:
+            int: The number of loaded queries.
+
+        Raises:
+            ValueError: If a hash of the file does not match its query.
+        """
+        with open(path, encoding="utf-8") as file:
+            content = json.load(file)
+        queries = content.items() if isinstance(content, dict) else ((query_hash(q), q) for q in content)
+        for sha256, query in queries:
+            if query_hash(query) != sha256:
+                raise ValueError(f"the hash {sha256} does not match its persisted query")
+            self._preloaded[sha256] = query
+        return len(self._preloaded)
+
+    def get(self, sha256: str) -> Optional[str]:
+        return self._preloaded.get(sha256) or self._registered.get(sha256)
+
+    def resolve(self, data: Any) -> None:
+        """
+        Fill the query of a persisted query request in place.
+
+        Args:
+            data (Any): The body of the GraphQL request.
+
+        Raises:
+            GraphQLError: If the hash is unknown or does not match the query sent with it.
+        """
+        if not isinstance(data, dict):
+            return
+        persisted = (data.get("extensions") or {}).get("persistedQuery")
+        if not isinstance(persisted, dict) or not (sha256 := persisted.get("sha256Hash")):
+            return
+        if (query := data.get("query")) is None:
+            if (query := self.get(sha256)) is None:
+                raise GraphQLError("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+            data["query"] = query
+        elif query_hash(query) != sha256:
+            raise GraphQLError("provided sha does not match query", extensions={"code": "BAD_REQUEST"})
+        elif self.get(sha256) is None and len(self._registered) < self.maxsize:
+            self._registered[sha256] = query
+
+
+document_cache = DocumentCache(config.DOCUMENT_CACHE_SIZE)
+persisted_queries = PersistedQueries(config.PERSISTED_QUERIES_SIZE)
@@ -0,0 +1,197 @@
+"""
+This module contains per-request batching loaders for the nested fields of the GraphQL schema.
+
+Every key requested during one tick of the event loop is collected and resolved with a single
+`IN (...)` query, so each nesting level of a query costs one round trip per relationship instead
+of one per parent object. Keys are deduplicated across sibling fields for the lifetime of a request.
+
+Classes:
+    DataLoader: Collects keys and resolves them in batches through a batch loading function.
+    Loaders: The set of loaders for the relationships of the schema, bound to one database session.
+
+Functions:
+    get_loaders: Returns the loaders attached to the request of the GraphQL context.
+"""
+
+import asyncio
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from db.models import Author, Book, BookRatingStats, Category, book_authors, book_categories
+from patisson_graphql.framework_utils.fastapi import GraphQLContext
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    """
+    Collect the keys requested during one event loop tick and resolve them in one batch.
+
+    Args:
+        batch_load_fn (Callable[[list[K]], Awaitable[dict[K, V]]]): Receives the unique keys of
+            a batch and returns the values found for them.
+        default (Callable[[], V]): Produces the value of a key missing from the batch result.
+
+    Notes:
+        Results are memoized per key, so a key requested by several sibling fields is fetched once.
+    """
+
+    def __init__(
+        self,
+        batch_load_fn: Callable[[list[K]], Awaitable[dict[K, V]]],
+        default: Callable[[], Optional[V]] = lambda: None,
+    ) -> None:
+        self._batch_load_fn = batch_load_fn
+        self._default = default
+        self._cache: dict[K, asyncio.Future] = {}
+        self._pending: list[K] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def load(self, key: K) -> "asyncio.Future[V]":
+        """
+        Schedule the key for the next batch.
+
+        Args:
+            key (K): The key to load.
+
+        Returns:
+            asyncio.Future[V]: A future resolved when the batch containing the key is fetched.
+        """
+        if (future := self._cache.get(key)) is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._cache[key] = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+        self._pending.append(key)
+        return future
+
+    async def load_many(self, keys: list[K]) -> list[V]:
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def _dispatch(self) -> None:
+        keys, self._pending = self._pending, []
+        task = asyncio.create_task(self._resolve(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, keys: list[K]) -> None:
+        try:
+            values = await self._batch_load_fn(keys)
+        except BaseException as e:
+            for key in keys:
+                future = self._cache.pop(key)  # forgotten, so a later load fetches it again
+                if isinstance(e, Exception) and not future.done():
+                    future.set_exception(e)
+                else:
+                    future.cancel()  # does nothing if the caller already cancelled it
+            if not isinstance(e, Exception):
+                raise
+            return
+        for key in keys:
+            if (future := self._cache[key]).cancelled():
+                del self._cache[key]  # its caller went away; a later load fetches it again
+            elif not future.done():
+                future.set_result(values[key] if key in values else self._default())
+
+
+class Loaders:
+    """
+    The loaders of the schema relationships, sharing one database session.
+
+    Args:
+        session (AsyncSession): The session of the current request.
+
+    Notes:
+        The session does not support concurrent operations, so batches of different loaders
+        dispatched in the same tick are executed one after another.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self._session = session
+        self._lock = asyncio.Lock()
+        self.authors_by_book: DataLoader[str, list[Author]] = DataLoader(self._authors_by_book, list)
+        self.categories_by_book: DataLoader[str, list[Category]] = DataLoader(self._categories_by_book, list)
+        self.books_by_author: DataLoader[str, list[Book]] = DataLoader(self._books_by_author, list)
+        self.books_by_category: DataLoader[str, list[Book]] = DataLoader(self._books_by_category, list)
+        self.book_by_id: DataLoader[str, Book] = DataLoader(self._book_by_id)
+        self.rating_by_book: DataLoader[str, BookRatingStats] = DataLoader(self._rating_by_book)
+
+    async def _execute(self, stmt: Select) -> list[Any]:
+        async with self._lock:
+            result = await self._session.execute(stmt)
+        return list(result.all())
+
+    async def _grouped(self, stmt: Select) -> dict[str, list[Any]]:
+        grouped = defaultdict(list)
+        for key, obj in await self._execute(stmt):
+            grouped[key].append(obj)
+        return grouped
+
+    async def _authors_by_book(self, book_ids: list[str]) -> dict[str, list[Author]]:
+        return await self._grouped(
+            select(book_authors.c.book_id, Author)
+            .join(Author, Author.name == book_authors.c.author_name)
+            .where(book_authors.c.book_id.in_(book_ids))
+            .order_by(Author.name)
+        )
+
+    async def _categories_by_book(self, book_ids: list[str]) -> dict[str, list[Category]]:
+        return await self._grouped(
+            select(book_categories.c.book_id, Category)
+            .join(Category, Category.name == book_categories.c.category_name)
+            .where(book_categories.c.book_id.in_(book_ids))
+            .order_by(Category.name)
+        )
+
+    async def _books_by_author(self, names: list[str]) -> dict[str, list[Book]]:
+        return await self._grouped(
+            select(book_authors.c.author_name, Book)
+            .join(Book, Book.id == book_authors.c.book_id)
+            .where(book_authors.c.author_name.in_(names))
+            .order_by(Book.id)
+        )
+
+    async def _books_by_category(self, names: list[str]) -> dict[str, list[Book]]:
+        return await self._grouped(
+            select(book_categories.c.category_name, Book)
+            .join(Book, Book.id == book_categories.c.book_id)
+            .where(book_categories.c.category_name.in_(names))
+            .order_by(Book.id)
+        )
+
+    async def _book_by_id(self, book_ids: list[str]) -> dict[str, Book]:
+        return {book.id: book for (book,) in await self._execute(select(Book).where(Book.id.in_(book_ids)))}
+
+    async def _rating_by_book(self, book_ids: list[str]) -> dict[str, BookRatingStats]:
+        return {
+            stats.book_id: stats
+            for (stats,) in await self._execute(
+                select(BookRatingStats).where(BookRatingStats.book_id.in_(book_ids))
+            )
+        }
+
+
+def get_loaders(context: GraphQLContext) -> Loaders:
+    """
+    Return the loaders of the current request, creating them on first use.
+
+    Args:
+        context (GraphQLContext): The GraphQL context containing the request and the session.
+
+    Returns:
+        Loaders: The loaders bound to the session of the context.
+
+    Notes:
+        The loaders are stored in the request state, so their memoized results live exactly
+        as long as the request.
+    """
+    state = context.request.state
+    loaders: Optional[Loaders] = getattr(state, "loaders", None)
+    if loaders is None:
+        loaders = state.loaders = Loaders(context.db_session)
+    return loaders
@@ -0,0 +1,95 @@
+"""
+This module contains keyset (cursor) pagination for the connection queries.
+
+The cursor of an object is its primary key: book and review ids are ULIDs, so ordering by them
+follows creation order, while authors and categories are ordered by name. Pages are fetched by
+seeking past the cursor on the primary key index instead of scanning and discarding skipped rows.
+
+Functions:
+    seek: Restricts a statement to the page following or preceding a cursor.
+    connection: Builds the connection result of a fetched page.
+"""
+
+from typing import Any, Callable, Optional, Sequence
+
+from graphql import GraphQLError
+from sqlalchemy import ColumnElement, Select
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+def seek(
+    stmt: Select,
+    key: ColumnElement,
+    first: Optional[int],
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> Select:
+    """
+    Restrict the statement to one page ordered by the key.
+
+    Args:
+        stmt (Select): The filtered statement.
+        key (ColumnElement): The primary key column used as the cursor.
+        first (Optional[int]): The page size; `None` means `DEFAULT_PAGE_SIZE`.
+        after (Optional[str]): Return the objects following this cursor.
+        before (Optional[str]): Return the objects preceding this cursor.
+
+    Returns:
+        Select: The statement fetching one object more than the page size, which signals
+            that another page exists.
+
+    Raises:
+        GraphQLError: If the page size is not between 1 and `MAX_PAGE_SIZE`.
+
+    Notes:
+        When only `before` is given, the page is read backwards from the cursor;
+        `connection` restores the ascending order.
+    """
+    first = DEFAULT_PAGE_SIZE if first is None else first
+    if not 1 <= first <= MAX_PAGE_SIZE:
+        raise GraphQLError(message=f"'first' must be between 1 and {MAX_PAGE_SIZE}")
+    if after is not None:
+        stmt = stmt.where(key > after)
+    if before is not None:
+        stmt = stmt.where(key < before)
+    backward = before is not None and after is None
+    return stmt.order_by(None).order_by(key.desc() if backward else key.asc()).limit(first + 1)
+
+
+def connection(
+    objs: Sequence[Any],
+    cursor: Callable[[Any], str],
+    first: Optional[int],
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> dict:
+    """
+    Build the connection result of a page fetched with `seek`.
+
+    Args:
+        objs (Sequence[Any]): The fetched objects, including the extra one.
+        cursor (Callable[[Any], str]): Returns the cursor of an object.
+        first (Optional[int]): The page size; `None` means `DEFAULT_PAGE_SIZE`.
+        after (Optional[str]): The `after` cursor of the request.
+        before (Optional[str]): The `before` cursor of the request.
+
+    Returns:
+        dict: The `items` of the page and its `pageInfo`.
+    """
+    first = DEFAULT_PAGE_SIZE if first is None else first
+    has_more = len(objs) > first
+    items = list(objs[:first])
+    backward = before is not None and after is None
+    if backward:
+        items.reverse()
+    return {
+        "items": items,
+        "pageInfo": {
+            "startCursor": cursor(items[0]) if items else None,
+            "endCursor": cursor(items[-1]) if items else None,
+            "hasNextPage": before is not None if backward else has_more,
+            "hasPreviousPage": has_more if backward else after is not None,
+        },
+    }
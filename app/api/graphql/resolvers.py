@@ -1,252 +1,592 @@
-from typing import Optional
+from operator import attrgetter
+from typing import Iterable, Optional
 
-from _db_filling import filling_db
+from api.graphql.cost import clamp_limit
 from api.graphql.deps import verify_tokens_decorator
-from ariadne import MutationType, QueryType
+from api.graphql.documents import document_cache
+from api.graphql.loaders import get_loaders
+from api.graphql.pagination import DEFAULT_PAGE_SIZE, connection, seek
+from api.graphql.selection import load_options, loaded, selected_paths
+from ariadne import MutationType, ObjectType, QueryType
+from cache import result_cache
+import config
 from config import logger
-from db.models import Author, Book, Category, Review
+from db.base import dialect_insert
+from db.models import Author, Book, BookRatingStats, Category, Review, ulid
+from db.ratings import record_rating, record_ratings
+from db.statements import log_statement, statement_stats
 from graphql import GraphQLResolveInfo
+from ingestion import ingestion_worker
 from patisson_graphql.framework_utils.fastapi import GraphQLContext
 from patisson_graphql.selected_fields import selected_fields
 from patisson_graphql.stmt_filter import Stmt
 from patisson_request.errors import ErrorCode, ErrorSchema, UniquenessError, ValidateError
 from patisson_request.jwt_tokens import ClientAccessTokenPayload, ServiceAccessTokenPayload
+from search import rank_books
+from sqlalchemy import Insert, Select, Update, update
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
+
+REVIEW_KEY_ARGUMENTS = {"ids": "review", "user_ids": "review:user", "books": "review:book"}
+RATING_ARGUMENTS = {"minRating": "rating:*", "orderBy": "rating:*"}
+REVIEW_EXISTS = "a review on this book ({book_id}) from this user ({user_id}) already exists"
+REVIEW_NOT_ACTIVE = (
+    "a review on this book ({book_id}) from this user ({user_id}) does not exist or is not active"
+)
 
 query = QueryType()
 mutation = MutationType()
+book = ObjectType("Book")
+author = ObjectType("Author")
+category = ObjectType("Category")
+review = ObjectType("Review")
 
 
-@query.field("books")
-@verify_tokens_decorator
-async def books(
-    _,
-    info: GraphQLResolveInfo,
-    service_token: ServiceAccessTokenPayload,
+def _books_stmt(
+    stmt: Stmt,
     ids: Optional[list[str]] = None,
     titles: Optional[list[str]] = None,
     like_title: Optional[str] = None,
+    google_ids: Optional[list[str]] = None,
     publishers: Optional[list[str]] = None,
     exact_publishedDate: Optional[str] = None,
     from_publishedDate: Optional[str] = None,
-    before_publishedDate: Optional[str] = None,
+    to_publishedDate: Optional[str] = None,
     like_description: Optional[str] = None,
     exact_pageCount: Optional[int] = None,
     from_pageCount: Optional[int] = None,
-    before_pageCount: Optional[int] = None,
+    to_pageCount: Optional[int] = None,
     maturityRaiting: Optional[str] = None,
     languages: Optional[list[str]] = None,
-    offset: Optional[int] = None,
-    limit: Optional[int] = 10,
-    search: Optional[list[str]] = None,
-):
-    context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
-    if search:
-        await filling_db(search, context.db_session)
-    stmt = (
-        Stmt(select(*selected_fields(info, Book)))
-        .con_filter(Book.id, ids)
+    authors: Optional[list[str]] = None,
+    categories: Optional[list[str]] = None,
+) -> Stmt:
+    return (
+        stmt.con_filter(Book.id, ids)
         .con_filter(Book.title, titles)
         .like_filter(Book.title, like_title)
+        .con_filter(Book.google_id, google_ids)
         .con_filter(Book.publisher, publishers)
         .eq_filter(Book.publishedDate, exact_publishedDate)
         .gte_filter(Book.publishedDate, from_publishedDate)
-        .lte_filter(Book.publishedDate, before_publishedDate)
+        .lte_filter(Book.publishedDate, to_publishedDate)
         .like_filter(Book.description, like_description)
         .eq_filter(Book.pageCount, exact_pageCount)
         .gte_filter(Book.pageCount, from_pageCount)
-        .lte_filter(Book.pageCount, before_pageCount)
+        .lte_filter(Book.pageCount, to_pageCount)
         .eq_filter(Book.maturityRating, maturityRaiting)
         .con_filter(Book.language, languages)
-        .offset(offset)
-        .limit(limit)
-        .ordered_by(Book.id)
+        .con_model_filter(Book.authors, authors)
+        .con_model_filter(Book.categories, categories)
     )
-    logger.info(stmt.log())
-    result = await context.db_session.execute(stmt())
+
+
+def _rated(stmt: Select, min_rating: Optional[float] = None, order_by: Optional[str] = None) -> Select:
+    if min_rating is None and order_by != "RATING":
+        return stmt
+    stmt = stmt.join(BookRatingStats, BookRatingStats.book_id == Book.id, isouter=min_rating is None)
+    if min_rating is not None:
+        stmt = stmt.where(BookRatingStats.average >= min_rating)
+    if order_by == "RATING":
+        stmt = stmt.order_by(None).order_by(BookRatingStats.average.desc().nulls_last(), Book.id)
+    return stmt
+
+
+def _authors_stmt(stmt: Stmt, names: Optional[list[str]] = None, like_names: Optional[str] = None) -> Stmt:
+    return stmt.con_filter(Author.name, names).like_filter(Author.name, like_names)
+
+
+def _categories_stmt(stmt: Stmt, names: Optional[list[str]] = None, like_names: Optional[str] = None) -> Stmt:
+    return stmt.con_filter(Category.name, names).like_filter(Category.name, like_names)
+
+
+def _reviews_stmt(
+    stmt: Stmt,
+    ids: Optional[list[str]] = None,
+    user_ids: Optional[list[str]] = None,
+    books: Optional[list[str]] = None,
+    stars: Optional[list[int]] = None,
+    from_stars: Optional[int] = None,
+    before_stars: Optional[int] = None,
+    comments: Optional[list[str]] = None,
+    like_comment: Optional[str] = None,
+    actual: Optional[bool] = True,
+) -> Stmt:
+    return (
+        stmt.con_filter(Review.id, ids)
+        .con_filter(Review.user_id, user_ids)
+        .con_filter(Review.book_id, books)
+        .con_filter(Review.stars, stars)
+        .gte_filter(Review.stars, from_stars)
+        .lte_filter(Review.stars, before_stars)
+        .con_filter(Review.comment, comments)
+        .like_filter(Review.comment, like_comment)
+        .con_filter(Review.actual, [actual])
+    )
+
+
+@query.field("books")
+@verify_tokens_decorator
+@result_cache.cached("book", {"ids": "book"}, RATING_ARGUMENTS, model=Book)
+async def books(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    offset: Optional[int] = None,
+    limit: Optional[int] = 10,
+    search: Optional[list[str]] = None,
+    wait_ms: Optional[int] = None,
+    text: Optional[str] = None,
+    minRating: Optional[float] = None,
+    orderBy: Optional[str] = None,
+    **filters,
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
+    if search:
+        await ingestion_worker.submit(search, wait_ms)
+    stmt = _books_stmt(Stmt(select(*selected_fields(info, Book))), **filters)
+    if text:
+        log_statement(stmt)
+        result = await context.db_session.execute(
+            await rank_books(context.db_session, _rated(stmt(), minRating), text, offset, clamp_limit(limit))
+        )
+        return result.fetchall()
+    stmt = stmt.offset(offset).limit(clamp_limit(limit)).ordered_by(Book.id)
+    log_statement(stmt)
+    result = await context.db_session.execute(_rated(stmt(), minRating, orderBy))
     return result.fetchall()
 
 
 @query.field("booksDeep")
 @verify_tokens_decorator
+@result_cache.cached("book", {"ids": "book"}, RATING_ARGUMENTS, fields=selected_paths)
 async def books_deep(
     _,
     info: GraphQLResolveInfo,
     service_token: ServiceAccessTokenPayload,
-    ids: Optional[list[str]] = None,
-    titles: Optional[list[str]] = None,
-    like_title: Optional[str] = None,
-    publishers: Optional[list[str]] = None,
-    exact_publishedDate: Optional[str] = None,
-    from_publishedDate: Optional[str] = None,
-    before_publishedDate: Optional[str] = None,
-    like_description: Optional[str] = None,
-    exact_pageCount: Optional[int] = None,
-    from_pageCount: Optional[int] = None,
-    before_pageCount: Optional[int] = None,
-    maturityRaiting: Optional[str] = None,
-    languages: Optional[list[str]] = None,
-    authors: Optional[list[str]] = None,
-    categories: Optional[list[str]] = None,
     offset: Optional[int] = None,
     limit: Optional[int] = 10,
     search: Optional[list[str]] = None,
+    wait_ms: Optional[int] = None,
+    text: Optional[str] = None,
+    minRating: Optional[float] = None,
+    orderBy: Optional[str] = None,
+    **filters,
 ):
     context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
     if search:
-        await filling_db(search, context.db_session)
-    stmt = (
-        Stmt(select(Book).options(joinedload(Book.authors), joinedload(Book.categories)))
-        .con_filter(Book.id, ids)
-        .con_filter(Book.title, titles)
-        .like_filter(Book.title, like_title)
-        .con_filter(Book.publisher, publishers)
-        .eq_filter(Book.publishedDate, exact_publishedDate)
-        .gte_filter(Book.publishedDate, from_publishedDate)
-        .lte_filter(Book.publishedDate, before_publishedDate)
-        .like_filter(Book.description, like_description)
-        .eq_filter(Book.pageCount, exact_pageCount)
-        .gte_filter(Book.pageCount, from_pageCount)
-        .lte_filter(Book.pageCount, before_pageCount)
-        .eq_filter(Book.maturityRating, maturityRaiting)
-        .con_filter(Book.language, languages)
-        .con_model_filter(Book.authors, authors)
-        .con_model_filter(Book.categories, categories)
-        .offset(offset)
-        .limit(limit)
-        .ordered_by(Book.id)
-    )
-    logger.info(stmt.log())
-    result = await context.db_session.execute(stmt())
+        await ingestion_worker.submit(search, wait_ms)
+    stmt = _books_stmt(Stmt(select(Book).options(*load_options(info, Book))), **filters)
+    if text:
+        log_statement(stmt)
+        result = await context.db_session.execute(
+            await rank_books(context.db_session, _rated(stmt(), minRating), text, offset, clamp_limit(limit))
+        )
+        return result.scalars().unique().all()
+    stmt = stmt.offset(offset).limit(clamp_limit(limit)).ordered_by(Book.id)
+    log_statement(stmt)
+    result = await context.db_session.execute(_rated(stmt(), minRating, orderBy))
     return result.scalars().unique().all()
 
 
+@query.field("booksConnection")
+@verify_tokens_decorator
+@result_cache.cached("book", {"ids": "book"}, fields=selected_paths)
+async def books_connection(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    first: Optional[int] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    search: Optional[list[str]] = None,
+    wait_ms: Optional[int] = None,
+    **filters,
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
+    if search:
+        await ingestion_worker.submit(search, wait_ms)
+    stmt = _books_stmt(Stmt(select(Book).options(*load_options(info, Book, ("items",)))), **filters)
+    log_statement(stmt)
+    result = await context.db_session.execute(seek(stmt(), Book.id, first, after, before))
+    return connection(result.scalars().all(), attrgetter("id"), first, after, before)
+
+
 @query.field("authors")
 @verify_tokens_decorator
+@result_cache.cached("author", {"names": "author"}, fields=selected_paths)
 async def authors(
     _,
     info: GraphQLResolveInfo,
     service_token: ServiceAccessTokenPayload,
-    names: Optional[list[str]] = None,
-    like_names: Optional[str] = None,
     offset: Optional[int] = None,
     limit: Optional[int] = 10,
     search: Optional[list[str]] = None,
+    wait_ms: Optional[int] = None,
+    **filters,
 ):
     context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
     if search:
-        await filling_db(search, context.db_session)
+        await ingestion_worker.submit(search, wait_ms)
     stmt = (
-        Stmt(select(Author).options(joinedload(Author.books)))
-        .con_filter(Author.name, names)
-        .like_filter(Author.name, like_names)
+        _authors_stmt(Stmt(select(Author).options(*load_options(info, Author))), **filters)
         .offset(offset)
-        .limit(limit)
-        .ordered_by(Book.id)
+        .limit(clamp_limit(limit))
+        .ordered_by(Author.name)
     )
-    logger.info(stmt.log())
+    log_statement(stmt)
     result = await context.db_session.execute(stmt())
     return result.scalars().unique().all()
 
 
+@query.field("authorsConnection")
+@verify_tokens_decorator
+@result_cache.cached("author", {"names": "author"}, fields=selected_paths)
+async def authors_connection(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    first: Optional[int] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    search: Optional[list[str]] = None,
+    wait_ms: Optional[int] = None,
+    **filters,
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
+    if search:
+        await ingestion_worker.submit(search, wait_ms)
+    stmt = _authors_stmt(Stmt(select(Author).options(*load_options(info, Author, ("items",)))), **filters)
+    log_statement(stmt)
+    result = await context.db_session.execute(seek(stmt(), Author.name, first, after, before))
+    return connection(result.scalars().all(), attrgetter("name"), first, after, before)
+
+
 @query.field("categories")
 @verify_tokens_decorator
+@result_cache.cached("category", {"names": "category"}, fields=selected_paths)
 async def categories(
     _,
     info: GraphQLResolveInfo,
     service_token: ServiceAccessTokenPayload,
-    names: Optional[list[str]] = None,
-    like_name: Optional[str] = None,
     offset: Optional[int] = None,
     limit: Optional[int] = 10,
     search: Optional[list[str]] = None,
+    wait_ms: Optional[int] = None,
+    **filters,
 ):
     context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
     if search:
-        await filling_db(search, context.db_session)
+        await ingestion_worker.submit(search, wait_ms)
     stmt = (
-        Stmt(select(Category).options(joinedload(Category.books)))
-        .con_filter(Category.name, names)
-        .like_filter(Author.name, like_name)
+        _categories_stmt(Stmt(select(Category).options(*load_options(info, Category))), **filters)
         .offset(offset)
-        .limit(limit)
-        .ordered_by(Book.id)
+        .limit(clamp_limit(limit))
+        .ordered_by(Category.name)
     )
-    logger.info(stmt.log())
+    log_statement(stmt)
     result = await context.db_session.execute(stmt())
     return result.scalars().unique().all()
 
 
+@query.field("categoriesConnection")
+@verify_tokens_decorator
+@result_cache.cached("category", {"names": "category"}, fields=selected_paths)
+async def categories_connection(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    first: Optional[int] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    search: Optional[list[str]] = None,
+    wait_ms: Optional[int] = None,
+    **filters,
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
+    if search:
+        await ingestion_worker.submit(search, wait_ms)
+    stmt = _categories_stmt(
+        Stmt(select(Category).options(*load_options(info, Category, ("items",)))), **filters
+    )
+    log_statement(stmt)
+    result = await context.db_session.execute(seek(stmt(), Category.name, first, after, before))
+    return connection(result.scalars().all(), attrgetter("name"), first, after, before)
+
+
 @query.field("reviews")
 @verify_tokens_decorator
+@result_cache.cached("review", REVIEW_KEY_ARGUMENTS, model=Review)
 async def reviews(
     _,
     info: GraphQLResolveInfo,
     service_token: ServiceAccessTokenPayload,
-    ids: Optional[list[str]] = None,
-    user_ids: Optional[list[str]] = None,
-    from_stars: Optional[int] = None,
-    before_stars: Optional[int] = None,
-    comment: Optional[str] = None,
-    actual: Optional[bool] = True,
     offset: Optional[int] = None,
     limit: Optional[int] = 10,
+    **filters,
 ):
     context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
     stmt = (
-        Stmt(select(*selected_fields(info, Review)))
-        .con_filter(Review.id, ids)
-        .con_filter(Review.user_id, user_ids)
-        .gte_filter(Review.stars, from_stars)
-        .lte_filter(Review.stars, before_stars)
-        .like_filter(Review.comment, comment)
-        .con_filter(Review.actual, [actual])
+        _reviews_stmt(Stmt(select(*selected_fields(info, Review))), **filters)
         .offset(offset)
-        .limit(limit)
+        .limit(clamp_limit(limit))
         .ordered_by(Review.id)
     )
-    logger.info(stmt.log())
+    log_statement(stmt)
     result = await context.db_session.execute(stmt())
     return result.fetchall()
 
 
 @query.field("reviewsDeep")
 @verify_tokens_decorator
+@result_cache.cached("review", REVIEW_KEY_ARGUMENTS, fields=selected_paths)
 async def reviews_deep(
     _,
     info: GraphQLResolveInfo,
     service_token: ServiceAccessTokenPayload,
-    ids: Optional[list[str]] = None,
-    user_ids: Optional[list[str]] = None,
-    from_stars: Optional[int] = None,
-    before_stars: Optional[int] = None,
-    comment: Optional[str] = None,
-    books: Optional[list[str]] = None,
-    actual: Optional[bool] = True,
     offset: Optional[int] = None,
     limit: Optional[int] = 10,
+    **filters,
 ):
     context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
     stmt = (
-        Stmt(select(Review))
-        .con_filter(Review.id, ids)
-        .con_filter(Review.user_id, user_ids)
-        .gte_filter(Review.stars, from_stars)
-        .lte_filter(Review.stars, before_stars)
-        .like_filter(Review.comment, comment)
-        .con_model_filter(Review.book, books)
-        .con_filter(Review.actual, [actual])
+        _reviews_stmt(Stmt(select(Review).options(*load_options(info, Review))), **filters)
         .offset(offset)
-        .limit(limit)
+        .limit(clamp_limit(limit))
         .ordered_by(Review.id)
     )
-    logger.info(stmt.log())
+    log_statement(stmt)
     result = await context.db_session.execute(stmt())
     return result.scalars().unique().all()
 
 
+@query.field("reviewsConnection")
+@verify_tokens_decorator
+@result_cache.cached("review", REVIEW_KEY_ARGUMENTS, fields=selected_paths)
+async def reviews_connection(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    first: Optional[int] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    **filters,
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, None] = info.context
+    stmt = _reviews_stmt(Stmt(select(Review).options(*load_options(info, Review, ("items",)))), **filters)
+    log_statement(stmt)
+    result = await context.db_session.execute(seek(stmt(), Review.id, first, after, before))
+    return connection(result.scalars().all(), attrgetter("id"), first, after, before)
+
+
+@query.field("ingestionStatus")
+@verify_tokens_decorator
+async def ingestion_status(_, info: GraphQLResolveInfo, service_token: ServiceAccessTokenPayload):
+    return ingestion_worker.status()
+
+
+@query.field("resultCacheStats")
+@verify_tokens_decorator
+async def result_cache_stats(_, info: GraphQLResolveInfo, service_token: ServiceAccessTokenPayload):
+    return result_cache.stats()
+
+
+@query.field("documentCacheStats")
+@verify_tokens_decorator
+async def document_cache_stats(_, info: GraphQLResolveInfo, service_token: ServiceAccessTokenPayload):
+    return document_cache.stats()
+
+
+@query.field("statementCacheStats")
+@verify_tokens_decorator
+async def statement_cache_stats(_, info: GraphQLResolveInfo, service_token: ServiceAccessTokenPayload):
+    return statement_stats.stats()
+
+
+def _review_row(review: Review) -> dict:
+    return {
+        "id": ulid(),
+        "user_id": review.user_id,
+        "book_id": review.book_id,
+        "stars": review.stars,
+        "comment": review.comment,
+    }
+
+
+def _insert_reviews(session: AsyncSession) -> Insert:
+    """Insert validated reviews, skipping those whose user already has an actual review of the book."""
+    return (
+        dialect_insert(session, Review.__table__)
+        .on_conflict_do_nothing(index_elements=[Review.user_id, Review.book_id], index_where=Review.actual)
+        .returning(Review.book_id)
+    )
+
+
+def _insert_review(session: AsyncSession, review: Review) -> Insert:
+    """Insert a validated review, unless its user already has an actual review of the book."""
+    return _insert_reviews(session).values(**_review_row(review))
+
+
+def _deactivate_reviews(user_id: str, book_ids: list[str]) -> Update:
+    """Mark the actual reviews of a user for books as no longer actual, returning their id and stars."""
+    return (
+        update(Review)
+        .where(Review.user_id == user_id, Review.book_id.in_(book_ids), Review.actual.is_(True))
+        .values(actual=False)
+        .returning(Review.id, Review.book_id, Review.stars)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _deactivate_review(user_id: str, book_id: str) -> Update:
+    """Mark the actual review of a user for a book as no longer actual, returning its id and stars."""
+    return _deactivate_reviews(user_id, [book_id])
+
+
+def _review_tags(user_id: str, book_id: str, *review_ids: str) -> set[str]:
+    return {"review:*", "rating:*", f"review:user:{user_id}", f"review:book:{book_id}"} | {
+        f"review:{review_id}" for review_id in review_ids
+    }
+
+
+class _ReviewBatch:
+    """
+    The items of a batch review mutation, validated on creation, and the errors of the rejected ones.
+
+    Args:
+        user_id (str): The author of the reviews.
+        items (list[dict]): The `ReviewInput` items, or `{"book_id": ...}` for a deletion.
+
+    Notes:
+        `reviews` holds the items still to be written by book id; rejecting an item removes it.
+    """
+
+    def __init__(self, user_id: str, items: list[dict]) -> None:
+        self.user_id = user_id
+        self.reviews: dict[str, Review] = {}
+        self.errors: list[Optional[list[dict]]] = [None] * len(items)
+        self.batch_errors: list[dict] = []
+        self._positions: dict[str, int] = {}
+        for position, item in enumerate(items):
+            book_id = item["book_id"]
+            if book_id in self._positions:
+                self._reject(
+                    position,
+                    ErrorCode.INVALID_PARAMETERS,
+                    f"the book ({book_id}) appears more than once in the batch",
+                )
+                continue
+            self._positions[book_id] = position
+            try:
+                self.reviews[book_id] = Review(user_id=user_id, **item)
+            except ValidateError as e:
+                self._reject(position, ErrorCode.VALIDATE_ERROR, str(e))
+
+    def _reject(self, position: int, code: ErrorCode, extra: str) -> None:
+        error = ErrorSchema(error=code, extra=extra)
+        logger.info(error)
+        self.errors[position] = [error.model_dump()]
+
+    def reject(self, book_id: str, code: ErrorCode, extra: str) -> None:
+        del self.reviews[book_id]
+        self._reject(self._positions[book_id], code, extra)
+
+    def fail(self, code: ErrorCode, extra: str) -> None:
+        """Reject every item not rejected yet, after the transaction of the batch was rolled back."""
+        error = ErrorSchema(error=code, extra=extra)
+        logger.info(error)
+        self.batch_errors.append(error.model_dump())
+        for book_id in list(self.reviews):
+            del self.reviews[book_id]
+            self.errors[self._positions[book_id]] = [error.model_dump()]
+
+    async def check_books(self, session: AsyncSession) -> None:
+        """Reject the items whose book does not exist, in one query."""
+        if not self.reviews:
+            return
+        found = set(await session.scalars(select(Book.id).where(Book.id.in_(list(self.reviews)))))
+        for book_id in [book_id for book_id in self.reviews if book_id not in found]:
+            self.reject(book_id, ErrorCode.INVALID_PARAMETERS, f"The book ({book_id}) was not found")
+
+    def reject_missing(self, found: Iterable[str], extra: str) -> None:
+        """Reject the items absent from `found`; `extra` is formatted with `book_id` and `user_id`."""
+        found = set(found)
+        for book_id in [book_id for book_id in self.reviews if book_id not in found]:
+            self.reject(
+                book_id, ErrorCode.INVALID_PARAMETERS, extra.format(book_id=book_id, user_id=self.user_id)
+            )
+
+    def response(self) -> dict:
+        return {
+            "success": not self.batch_errors and all(errors is None for errors in self.errors),
+            "errors": self.batch_errors or None,
+            "items": [{"success": errors is None, "errors": errors} for errors in self.errors],
+        }
+
+
+def _batch_too_large(size: int) -> Optional[dict]:
+    if size <= config.REVIEWS_BATCH_MAX_SIZE:
+        return None
+    error = ErrorSchema(
+        error=ErrorCode.INVALID_PARAMETERS,
+        extra=f"{size} reviews were given, at most {config.REVIEWS_BATCH_MAX_SIZE} are accepted",
+    )
+    logger.info(error)
+    return {"success": False, "errors": [error.model_dump()], "items": []}
+
+
+@book.field("authors")
+async def resolve_book_authors(obj, info: GraphQLResolveInfo):
+    if (authors := loaded(obj, "authors")) is not None:
+        return authors
+    if (book_id := getattr(obj, "id", None)) is None:
+        return None
+    return await get_loaders(info.context).authors_by_book.load(book_id)
+
+
+@book.field("categories")
+async def resolve_book_categories(obj, info: GraphQLResolveInfo):
+    if (categories := loaded(obj, "categories")) is not None:
+        return categories
+    if (book_id := getattr(obj, "id", None)) is None:
+        return None
+    return await get_loaders(info.context).categories_by_book.load(book_id)
+
+
+@book.field("rating")
+async def resolve_book_rating(obj, info: GraphQLResolveInfo):
+    if (book_id := getattr(obj, "id", None)) is None:
+        return None
+    stats = await get_loaders(info.context).rating_by_book.load(book_id)
+    if stats is None:
+        return {"count": 0, "average": None, "histogram": [0] * 5}
+    return {"count": stats.reviews_count, "average": stats.average, "histogram": stats.histogram}
+
+
+@author.field("books")
+async def resolve_author_books(obj: Author, info: GraphQLResolveInfo):
+    if (books := loaded(obj, "books")) is not None:
+        return books
+    return await get_loaders(info.context).books_by_author.load(obj.name)
+
+
+@category.field("books")
+async def resolve_category_books(obj: Category, info: GraphQLResolveInfo):
+    if (books := loaded(obj, "books")) is not None:
+        return books
+    return await get_loaders(info.context).books_by_category.load(obj.name)
+
+
+@review.field("book")
+async def resolve_review_book(obj, info: GraphQLResolveInfo):
+    if (book := loaded(obj, "book")) is not None:
+        return book
+    if (book_id := getattr(obj, "book_id", None)) is None:
+        return None
+    return await get_loaders(info.context).book_by_id.load(book_id)
+
+
 @mutation.field("createReview")
 @verify_tokens_decorator
 async def create_review(
@@ -261,21 +601,12 @@ async def create_review(
     context: GraphQLContext[ServiceAccessTokenPayload, ClientAccessTokenPayload] = info.context
     try:
         new_review = Review(user_id=client_token.sub, book_id=book_id, stars=stars, comment=comment)
-
-        # checking the uniqueness of the review
-        stmt = (
-            Stmt(select(Review))
-            .con_filter(Review.user_id, [client_token.sub])
-            .con_filter(Review.book_id, [book_id])
-            .con_filter(Review.actual, [True])
-        )
-        result = await context.db_session.execute(stmt())
-        if result.scalars().all():
+        result = await context.db_session.execute(_insert_review(context.db_session, new_review))
+        if result.scalar_one_or_none() is None:
             raise UniquenessError
-
-        logger.info(stmt.log())
-        context.db_session.add(new_review)
+        await record_rating(context.db_session, book_id, added=stars)
         await context.db_session.commit()
+        await result_cache.invalidate(_review_tags(client_token.sub, book_id))
         return {"success": True}
 
     except IntegrityError:
@@ -291,9 +622,10 @@ async def create_review(
         return {"success": False, "errors": error.model_dump()}
 
     except UniquenessError:
+        await context.db_session.rollback()
         error = ErrorSchema(
             error=ErrorCode.INVALID_PARAMETERS,
-            extra=f"a review on this book ({book_id}) from this user ({client_token.sub}) already exists",
+            extra=REVIEW_EXISTS.format(book_id=book_id, user_id=client_token.sub),
         )
         logger.info(error)
         return {"success": False, "errors": error.model_dump()}
@@ -318,21 +650,16 @@ async def update_review(
     context: GraphQLContext[ServiceAccessTokenPayload, ClientAccessTokenPayload] = info.context
     try:
         new_review = Review(user_id=client_token.sub, book_id=book_id, stars=stars, comment=comment)
-
-        stmt = (
-            Stmt(select(Review))
-            .con_filter(Review.user_id, [client_token.sub])
-            .con_filter(Review.book_id, [book_id])
-            .con_filter(Review.actual, [True])
-        )
-        result = await context.db_session.execute(stmt())
-        not_actual_review = result.scalar_one_or_none()
+        result = await context.db_session.execute(_deactivate_review(client_token.sub, book_id))
+        not_actual_review = result.one_or_none()
         if not not_actual_review:
             raise UniquenessError
-        not_actual_review.actual = False
-
-        context.db_session.add(new_review)
+        result = await context.db_session.execute(_insert_review(context.db_session, new_review))
+        if result.scalar_one_or_none() is None:
+            raise UniquenessError
+        await record_rating(context.db_session, book_id, added=stars, removed=not_actual_review.stars)
         await context.db_session.commit()
+        await result_cache.invalidate(_review_tags(client_token.sub, book_id, not_actual_review.id))
         return {"success": True}
 
     except IntegrityError:
@@ -348,12 +675,10 @@ async def update_review(
         return {"success": False, "errors": error.model_dump()}
 
     except UniquenessError:
+        await context.db_session.rollback()
         error = ErrorSchema(
             error=ErrorCode.INVALID_PARAMETERS,
-            extra=(
-                f"a review on this book ({book_id}) from this user "
-                f"({client_token.sub}) does not exist or is not active"
-            ),
+            extra=REVIEW_NOT_ACTIVE.format(book_id=book_id, user_id=client_token.sub),
         )
         logger.info(error)
         return {"success": False, "errors": error.model_dump()}
@@ -375,18 +700,13 @@ async def delete_review(
 ):
     context: GraphQLContext[ServiceAccessTokenPayload, ClientAccessTokenPayload] = info.context
     try:
-        stmt = (
-            Stmt(select(Review))
-            .con_filter(Review.user_id, [client_token.sub])
-            .con_filter(Review.book_id, [book_id])
-            .con_filter(Review.actual, [True])
-        )
-        result = await context.db_session.execute(stmt())
-        not_actual_review = result.scalar_one_or_none()
+        result = await context.db_session.execute(_deactivate_review(client_token.sub, book_id))
+        not_actual_review = result.one_or_none()
         if not not_actual_review:
             raise UniquenessError
-        not_actual_review.actual = False
+        await record_rating(context.db_session, book_id, removed=not_actual_review.stars)
         await context.db_session.commit()
+        await result_cache.invalidate(_review_tags(client_token.sub, book_id, not_actual_review.id))
         return {"success": True}
 
     except IntegrityError:
@@ -402,12 +722,10 @@ async def delete_review(
         return {"success": False, "errors": [error.model_dump()]}
 
     except UniquenessError:
+        await context.db_session.rollback()
         error = ErrorSchema(
             error=ErrorCode.INVALID_PARAMETERS,
-            extra=(
-                f"a review on this book ({book_id}) from this user "
-                f"({client_token.sub}) does not exist or is not active"
-            ),
+            extra=REVIEW_NOT_ACTIVE.format(book_id=book_id, user_id=client_token.sub),
         )
         logger.info(error)
         return {"success": False, "errors": [error.model_dump()]}
@@ -418,4 +736,125 @@ async def delete_review(
         return {"success": False, "errors": [error.model_dump()]}
 
 
-resolvers = [query, mutation]
+@mutation.field("createReviews")
+@verify_tokens_decorator
+async def create_reviews(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    client_token: ClientAccessTokenPayload,
+    reviews: list[dict],
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, ClientAccessTokenPayload] = info.context
+    if (response := _batch_too_large(len(reviews))) is not None:
+        return response
+    batch = _ReviewBatch(client_token.sub, reviews)
+    session = context.db_session
+    try:
+        await batch.check_books(session)
+        if batch.reviews:
+            result = await session.execute(
+                _insert_reviews(session), [_review_row(review) for review in batch.reviews.values()]
+            )
+            batch.reject_missing(result.scalars(), REVIEW_EXISTS)
+            await record_ratings(
+                session, [(book_id, review.stars, None) for book_id, review in batch.reviews.items()]
+            )
+            await session.commit()
+            await result_cache.invalidate(
+                set().union(*(_review_tags(client_token.sub, book_id) for book_id in batch.reviews))
+            )
+    except SQLAlchemyError as e:
+        await session.rollback()
+        batch.fail(ErrorCode.INVALID_PARAMETERS, str(e))
+    return batch.response()
+
+
+@mutation.field("updateReviews")
+@verify_tokens_decorator
+async def update_reviews(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    client_token: ClientAccessTokenPayload,
+    reviews: list[dict],
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, ClientAccessTokenPayload] = info.context
+    if (response := _batch_too_large(len(reviews))) is not None:
+        return response
+    batch = _ReviewBatch(client_token.sub, reviews)
+    session = context.db_session
+    try:
+        if batch.reviews:
+            result = await session.execute(_deactivate_reviews(client_token.sub, list(batch.reviews)))
+            previous = {row.book_id: row for row in result}
+            batch.reject_missing(previous, REVIEW_NOT_ACTIVE)
+        if batch.reviews:
+            result = await session.execute(
+                _insert_reviews(session), [_review_row(review) for review in batch.reviews.values()]
+            )
+            if len(result.all()) < len(batch.reviews):
+                raise UniquenessError
+            await record_ratings(
+                session,
+                [
+                    (book_id, review.stars, previous[book_id].stars)
+                    for book_id, review in batch.reviews.items()
+                ],
+            )
+            await session.commit()
+            await result_cache.invalidate(
+                set().union(
+                    *(
+                        _review_tags(client_token.sub, book_id, previous[book_id].id)
+                        for book_id in batch.reviews
+                    )
+                )
+            )
+    except SQLAlchemyError as e:
+        await session.rollback()
+        batch.fail(ErrorCode.INVALID_PARAMETERS, str(e))
+    except UniquenessError:
+        await session.rollback()
+        batch.fail(ErrorCode.INVALID_PARAMETERS, "the reviews were changed concurrently")
+    return batch.response()
+
+
+@mutation.field("deleteReviews")
+@verify_tokens_decorator
+async def delete_reviews(
+    _,
+    info: GraphQLResolveInfo,
+    service_token: ServiceAccessTokenPayload,
+    client_token: ClientAccessTokenPayload,
+    book_ids: list[str],
+):
+    context: GraphQLContext[ServiceAccessTokenPayload, ClientAccessTokenPayload] = info.context
+    if (response := _batch_too_large(len(book_ids))) is not None:
+        return response
+    batch = _ReviewBatch(client_token.sub, [{"book_id": book_id} for book_id in book_ids])
+    session = context.db_session
+    try:
+        if batch.reviews:
+            result = await session.execute(_deactivate_reviews(client_token.sub, list(batch.reviews)))
+            previous = {row.book_id: row for row in result}
+            batch.reject_missing(previous, REVIEW_NOT_ACTIVE)
+            await record_ratings(
+                session, [(book_id, None, previous[book_id].stars) for book_id in batch.reviews]
+            )
+            await session.commit()
+            await result_cache.invalidate(
+                set().union(
+                    *(
+                        _review_tags(client_token.sub, book_id, previous[book_id].id)
+                        for book_id in batch.reviews
+                    )
+                )
+            )
+    except SQLAlchemyError as e:
+        await session.rollback()
+        batch.fail(ErrorCode.INVALID_PARAMETERS, str(e))
+    return batch.response()
+
+
+resolvers = [query, mutation, book, author, category, review]
@@ -0,0 +1,181 @@
+"""
+This module contains the FastAPI endpoint serving the GraphQL schema.
+
+Functions:
+    create_graphql_route: Builds the endpoint executing GraphQL requests against the resolvers.
+"""
+
+import os
+from typing import Any, AsyncContextManager, Callable, Optional
+
+import config
+from api.graphql.cost import analyze, budget
+from api.graphql.deps import verify_service_token
+from api.graphql.documents import document_cache, persisted_queries
+from ariadne import graphql, load_schema_from_path, make_executable_schema
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    GraphQLError,
+    GraphQLSchema,
+    NullValueNode,
+    OperationDefinitionNode,
+    OperationType,
+    VariableNode,
+    get_operation_ast,
+)
+from metrics import current_resolver, instrument_schema, resolver_label
+from patisson_graphql.framework_utils.fastapi import GraphQLContext
+from sqlalchemy.ext.asyncio import AsyncSession
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema.graphql")
+
+
+async def _service(request: Request) -> Optional[str]:
+    try:
+        payload = await verify_service_token(GraphQLContext(request=request, db_session=None))
+    except GraphQLError:
+        return None  # the resolvers reject the request
+    return getattr(payload, "sub", None)
+
+
+async def _check_cost(
+    schema: GraphQLSchema,
+    request: Request,
+    document: DocumentNode,
+    operation: OperationDefinitionNode,
+    data: dict,
+) -> tuple[dict, Optional[GraphQLError]]:
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    variables = data.get("variables")
+    cost = analyze(schema, operation, fragments, variables if isinstance(variables, dict) else None)
+    service_budget = budget(await _service(request))
+    extensions = {"cost": {"estimated": cost.cost, "depth": cost.depth, "budget": service_budget}}
+    if cost.depth > config.QUERY_MAX_DEPTH:
+        message = f"The query depth {cost.depth} exceeds the maximum of {config.QUERY_MAX_DEPTH}"
+    elif cost.cost > service_budget:
+        message = f"The estimated query cost {cost.cost} exceeds the budget of {service_budget}"
+    else:
+        return extensions, None
+    return extensions, GraphQLError(message, extensions={"code": "QUERY_TOO_COMPLEX"})
+
+
+def _waits_for_ingestion(operation: OperationDefinitionNode, variables: Optional[dict]) -> bool:
+    """Tell whether a root field of the operation waits for its search terms to be ingested."""
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, FieldNode):
+            continue
+        for argument in selection.arguments or ():
+            if argument.name.value != "wait_ms" or isinstance(argument.value, NullValueNode):
+                continue
+            if not isinstance(argument.value, VariableNode):
+                return True
+            if variables and variables.get(argument.value.name.value):
+                return True
+    return False
+
+
+def create_graphql_route(
+    resolvers: list[Any],
+    get_session: Callable[[], AsyncContextManager[AsyncSession]],
+    get_read_session: Optional[Callable[[Optional[str]], AsyncContextManager[AsyncSession]]] = None,
+    record_write: Optional[Callable[[Optional[str]], None]] = None,
+):
+    """
+    Build the endpoint executing GraphQL requests.
+
+    Args:
+        resolvers (list[Any]): The ariadne bindables of the schema.
+        get_session (Callable[[], AsyncContextManager[AsyncSession]]): Opens the database session
+            of a request.
+        get_read_session (Optional[Callable[[Optional[str]], AsyncContextManager[AsyncSession]]]):
+            Opens the session of a query operation, given the caller identity. Queries use
+            `get_session` if omitted.
+        record_write (Optional[Callable[[Optional[str]], None]]): Called with the caller identity
+            after each mutation, so its following queries can read its writes.
+
+    Returns:
+        Callable: The endpoint, to be registered for POST requests.
+
+    Notes:
+        Documents are parsed and validated through `document_cache`, and requests sending only
+        the hash of a persisted query are resolved through `persisted_queries`. The caller
+        identity is its client token, or its service token for requests without a client.
+        The cost of each operation is checked against the budget of the calling service before
+        it is executed, and is returned in the `cost` entry of the response extensions. The SQL
+        statements of the whole operation, nested fields and loaders included, are attributed
+        to its root field in the metrics. Queries passing `wait_ms` read from the primary,
+        where the search terms they wait for are ingested.
+    """
+    schema = make_executable_schema(load_schema_from_path(SCHEMA_PATH), *resolvers)
+    instrument_schema(schema)
+
+    async def graphql_route(request: Request) -> JSONResponse:
+        try:
+            data = await request.json()
+        except ValueError:
+            return JSONResponse(
+                {"errors": [{"message": "The request body is not valid JSON"}]}, status_code=400
+            )
+        try:
+            persisted_queries.resolve(data)
+        except GraphQLError as e:
+            return JSONResponse({"errors": [e.formatted]})
+
+        document: Optional[DocumentNode] = None
+        operation: Optional[OperationDefinitionNode] = None
+        if isinstance(data, dict) and isinstance(data.get("query"), str):
+            try:
+                document = document_cache.parse(None, data)
+            except GraphQLError:
+                pass
+            else:
+                operation = get_operation_ast(document, data.get("operationName"))
+        extensions: dict = {}
+        if document is not None and operation is not None:
+            extensions, error = await _check_cost(schema, request, document, operation, data)
+            if error is not None:
+                return JSONResponse({"errors": [error.formatted], "extensions": extensions}, status_code=400)
+        writer = request.headers.get("X-Client-Token") or request.headers.get("Authorization")
+        is_query = operation is not None and operation.operation == OperationType.QUERY
+        variables = data.get("variables") if isinstance(data, dict) else None
+        if (
+            is_query
+            and get_read_session
+            and not _waits_for_ingestion(operation, variables if isinstance(variables, dict) else None)
+        ):
+            open_session = get_read_session(writer)
+        else:
+            open_session = get_session()
+
+        root_fields = [
+            selection.name.value
+            for selection in (operation.selection_set.selections if operation is not None else ())
+            if isinstance(selection, FieldNode)
+        ]
+        token = current_resolver.set(resolver_label(root_fields))
+        try:
+            async with open_session as session:
+                success, result = await graphql(
+                    schema,
+                    data,
+                    context_value=GraphQLContext(request=request, db_session=session),
+                    query_parser=(lambda _, __: document) if document is not None else document_cache.parse,
+                    query_validator=document_cache.validate,
+                )
+        finally:
+            current_resolver.reset(token)
+        if not is_query and document is not None and record_write is not None:
+            record_write(writer)
+        if extensions and isinstance(result, dict):
+            result.setdefault("extensions", {}).update(extensions)
+        return JSONResponse(result, status_code=200 if success else 400)
+
+    return graphql_route
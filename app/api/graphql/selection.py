@@ -0,0 +1,136 @@
+"""
+This module derives the SQLAlchemy loader options of a query from its GraphQL selection set.
+
+Only the selected columns of the returned objects are fetched, together with their primary key
+and the foreign keys their selected relationships are resolved from, and only the selected
+relationships are loaded. Relationships are loaded with `selectinload`, one `IN (...)` query per
+relationship and nesting level, so the number of fetched rows stays linear in the number of
+objects. Below `MAX_EAGER_DEPTH` nesting levels, relationships are left to the batching loaders of
+`api.graphql.loaders`, which the nested field resolvers fall back to when nothing was loaded.
+
+Functions:
+    load_options: Builds the loader options of the objects selected by a query.
+    selected_paths: Lists the selected fields, for the result cache key.
+    loaded: Returns a relationship of an object if it was eagerly loaded.
+"""
+
+from typing import Any, Optional
+
+from db.models import Author, Book, Category, Review
+from graphql import FieldNode, FragmentSpreadNode, GraphQLResolveInfo, InlineFragmentNode, SelectionSetNode
+from sqlalchemy.orm import load_only, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+MAX_EAGER_DEPTH = 3
+
+RELATIONSHIPS: dict[Any, dict[str, Any]] = {
+    Book: {"authors": Book.authors, "categories": Book.categories},
+    Author: {"books": Author.books},
+    Category: {"books": Category.books},
+    Review: {"book": Review.book},
+}
+KEYS: dict[Any, dict[str, list[Any]]] = {Review: {"book": [Review.book_id]}}
+
+
+def _collect(
+    info: GraphQLResolveInfo,
+    selection_set: Optional[SelectionSetNode],
+    fields: dict[str, list[SelectionSetNode]],
+) -> dict[str, list[SelectionSetNode]]:
+    if selection_set is None:
+        return fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            sets = fields.setdefault(selection.name.value, [])
+            if selection.selection_set is not None:
+                sets.append(selection.selection_set)
+        elif isinstance(selection, InlineFragmentNode):
+            _collect(info, selection.selection_set, fields)
+        elif isinstance(selection, FragmentSpreadNode):
+            _collect(info, info.fragments[selection.name.value].selection_set, fields)
+    return fields
+
+
+def _fields(
+    info: GraphQLResolveInfo, selection_sets: list[SelectionSetNode]
+) -> dict[str, list[SelectionSetNode]]:
+    fields: dict[str, list[SelectionSetNode]] = {}
+    for selection_set in selection_sets:
+        _collect(info, selection_set, fields)
+    return fields
+
+
+def _root(info: GraphQLResolveInfo, path: tuple[str, ...]) -> list[SelectionSetNode]:
+    selection_sets = [node.selection_set for node in info.field_nodes if node.selection_set is not None]
+    for name in path:
+        selection_sets = _fields(info, selection_sets).get(name, [])
+    return selection_sets
+
+
+def _options(
+    info: GraphQLResolveInfo, model: Any, selection_sets: list[SelectionSetNode], depth: int
+) -> list:
+    fields = _fields(info, selection_sets)
+    columns = model.__table__.columns
+    attributes = [getattr(model, column.key) for column in model.__mapper__.primary_key]
+    attributes += [getattr(model, name) for name in fields if name in columns]
+    options: list[LoaderOption] = []
+    for name, relationship in RELATIONSHIPS.get(model, {}).items():
+        if name not in fields:
+            continue
+        attributes += KEYS.get(model, {}).get(name, [])
+        if depth < MAX_EAGER_DEPTH:
+            target = relationship.property.mapper.class_
+            options.append(
+                selectinload(relationship).options(*_options(info, target, fields[name], depth + 1))
+            )
+    return [load_only(*dict.fromkeys(attributes)), *options]
+
+
+def load_options(info: GraphQLResolveInfo, model: Any, path: tuple[str, ...] = ()) -> list:
+    """
+    Build the loader options of the objects selected by the current field.
+
+    Args:
+        info (GraphQLResolveInfo): The resolve info of the root field.
+        model (Any): The model of the returned objects.
+        path (tuple[str, ...]): The fields leading from the root field to the objects, such as
+            `("items",)` for a connection.
+
+    Returns:
+        list: The `load_only` and `selectinload` options to apply to the statement.
+    """
+    return _options(info, model, _root(info, path), 1)
+
+
+def _paths(info: GraphQLResolveInfo, selection_sets: list[SelectionSetNode], prefix: str) -> list[str]:
+    paths = []
+    for name, nested in _fields(info, selection_sets).items():
+        paths.append(prefix + name)
+        paths.extend(_paths(info, nested, f"{prefix}{name}."))
+    return paths
+
+
+def selected_paths(info: GraphQLResolveInfo) -> list[str]:
+    """
+    List the dotted paths of every field selected below the current field.
+
+    Notes:
+        Objects loaded with `load_options` miss the attributes that were not selected, so a
+        cached result may only be reused by queries with the same selection.
+    """
+    return _paths(info, _root(info, ()), "")
+
+
+def loaded(obj: Any, name: str) -> Optional[Any]:
+    """
+    Return a relationship of an object if it was eagerly loaded.
+
+    Args:
+        obj (Any): A model instance or a row of selected columns.
+        name (str): The name of the relationship.
+
+    Returns:
+        Optional[Any]: The related object or list, or `None` if the relationship was not loaded.
+    """
+    return getattr(obj, "__dict__", {}).get(name)
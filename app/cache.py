@@ -0,0 +1,318 @@
+"""
+This module contains the result cache placed in front of the query resolvers.
+
+A cached result is stored under a key built from the resolver name, the normalized filter
+arguments and the selected fields, and is labelled with tags describing what it depends on:
+`<entity>:<key>` for lookups by primary key (or by another key filter) and `<entity>:*` for
+any other listing. Writes invalidate only the tags they affect.
+
+Classes:
+    CacheBackend: The interface of a cache store.
+    MemoryBackend: An in-process LRU store with TTL expiry.
+    RedisBackend: A store shared between processes through Redis.
+    ResultCache: Caches resolver results and tracks hit/miss statistics.
+
+Attributes:
+    result_cache: The result cache shared by the application.
+"""
+
+import hashlib
+import json
+import pickle
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional
+
+import config
+from graphql import GraphQLResolveInfo
+from patisson_graphql.selected_fields import selected_fields
+
+_MISSING = object()
+_NOT_CACHED_ARGUMENTS = ("service_token", "client_token")
+
+
+class CacheBackend(ABC):
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        """Return the cached value or `_MISSING`."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        """Store the value under the key, labelled with the tags."""
+
+    @abstractmethod
+    async def invalidate(self, tags: Iterable[str]) -> int:
+        """Drop the values labelled with any of the tags and return how many were dropped."""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Drop every value."""
+
+    @abstractmethod
+    def size(self) -> Optional[int]:
+        """Return the number of stored values, if known."""
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process LRU store with TTL expiry.
+
+    Args:
+        maxsize (int): The maximum number of values; the least recently used one is evicted first.
+        ttl (float): Seconds after which a value expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._values: OrderedDict[str, tuple[float, Any, frozenset[str]]] = OrderedDict()
+        self._tags: defaultdict[str, set[str]] = defaultdict(set)
+
+    def _drop(self, key: str) -> None:
+        _, _, tags = self._values.pop(key)
+        for tag in tags:
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    async def get(self, key: str) -> Any:
+        entry = self._values.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            return _MISSING
+        self._values.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        if key in self._values:
+            self._drop(key)
+        tags = frozenset(tags)
+        self._values[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags[tag].add(key)
+        while len(self._values) > self.maxsize:
+            self._drop(next(iter(self._values)))
+            self.evictions += 1
+
+    async def invalidate(self, tags: Iterable[str]) -> int:
+        keys = set().union(*(self._tags.get(tag, ()) for tag in tags))
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    async def clear(self) -> None:
+        self._values.clear()
+        self._tags.clear()
+
+    def size(self) -> Optional[int]:
+        return len(self._values)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Store shared between the service instances through Redis.
+
+    Args:
+        url (str): The Redis connection URL.
+        ttl (float): Seconds after which a value expires.
+        prefix (str): The prefix of every key written by the cache.
+
+    Notes:
+        Size-bounded eviction is delegated to the `maxmemory-policy` of the Redis server.
+        Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str, ttl: float, prefix: str = f"{config.SERVICE_NAME}:cache:") -> None:
+        try:
+            from redis.asyncio import from_url
+        except ImportError as e:
+            raise ImportError("the shared result cache requires the 'redis' package") from e
+        self._redis = from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Any:
+        value = await self._redis.get(self.prefix + key)
+        return _MISSING if value is None else pickle.loads(value)
+
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        ttl = max(1, round(self.ttl))
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+            for tag in tags:
+                pipe.sadd(f"{self.prefix}tag:{tag}", key)
+                pipe.expire(f"{self.prefix}tag:{tag}", ttl)
+            await pipe.execute()
+
+    async def invalidate(self, tags: Iterable[str]) -> int:
+        tag_keys = [f"{self.prefix}tag:{tag}" for tag in tags]
+        if not tag_keys:
+            return 0
+        keys = await self._redis.sunion(*tag_keys)
+        if keys:
+            await self._redis.delete(*(self.prefix + key.decode() for key in keys))
+        await self._redis.delete(*tag_keys)
+        return len(keys)
+
+    async def clear(self) -> None:
+        async for key in self._redis.scan_iter(match=f"{self.prefix}*"):
+            await self._redis.delete(key)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class ResultCache:
+    """
+    Cache of resolver results with tag-based invalidation.
+
+    Args:
+        backend (CacheBackend): The store of the cached results.
+        replica_lag (float): Seconds after an invalidation during which results read from a
+            replica are not stored, as the replica may not have replayed the write yet.
+
+    Notes:
+        A result computed while an invalidation happened is not stored, so a read racing with
+        a write in the same process cannot put a stale result back into the cache. Only the
+        invalidations of the same process are known, so with a shared backend a replica read
+        may still store a result older than a write of another instance, for at most the TTL.
+    """
+
+    def __init__(self, backend: CacheBackend, replica_lag: float = 0.0) -> None:
+        self.backend = backend
+        self.replica_lag = replica_lag
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._generation = 0
+        self._invalidated_at = float("-inf")
+
+    @staticmethod
+    def _normalize(value: Any) -> Any:
+        if isinstance(value, (list, tuple, set)):
+            return sorted({json.dumps(item, sort_keys=True, default=str) for item in value})
+        return value
+
+    def key(self, name: str, kwargs: dict, fields: Iterable[str]) -> str:
+        arguments = {
+            argument: self._normalize(value)
+            for argument, value in kwargs.items()
+            if value is not None and argument not in _NOT_CACHED_ARGUMENTS
+        }
+        raw = json.dumps([name, arguments, sorted(fields)], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def tags(
+        entity: str, key_arguments: dict[str, str], dependent_arguments: dict[str, str], kwargs: dict
+    ) -> set[str]:
+        tags = {tag for argument, tag in dependent_arguments.items() if kwargs.get(argument) is not None}
+        for argument, prefix in key_arguments.items():
+            if values := kwargs.get(argument):
+                return tags | {f"{prefix}:{value}" for value in values}
+        return tags | {f"{entity}:*"}
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        """
+        Drop the cached results labelled with any of the tags.
+
+        Args:
+            tags (Iterable[str]): The tags affected by a write.
+        """
+        self._generation += 1
+        self._invalidated_at = time.monotonic()
+        self.invalidations += await self.backend.invalidate(tags)
+
+    def _lagging(self, info: GraphQLResolveInfo) -> bool:
+        session = getattr(info.context, "db_session", None)
+        return (
+            session is not None
+            and session.info.get("replica", False)
+            and time.monotonic() - self._invalidated_at < self.replica_lag
+        )
+
+    def cached(
+        self,
+        entity: str,
+        key_arguments: Optional[dict[str, str]] = None,
+        dependent_arguments: Optional[dict[str, str]] = None,
+        model: Any = None,
+        bypass: Iterable[str] = ("search", "wait_ms"),
+        fields: Optional[Callable[[GraphQLResolveInfo], Iterable[str]]] = None,
+    ):
+        """
+        Cache the results of a query resolver.
+
+        Args:
+            entity (str): The entity of the `<entity>:*` listing tag.
+            key_arguments (Optional[dict[str, str]]): Filter arguments that restrict the result to
+                known keys, mapped to the prefix of their tags. The first one given is used.
+            dependent_arguments (Optional[dict[str, str]]): Arguments that make the result depend
+                on other data, mapped to the tag added when they are given.
+            model (Any): For resolvers returning rows of the selected columns only, the model
+                whose selected fields are part of the key.
+            bypass (Iterable[str]): Arguments that disable the cache when given.
+            fields (Optional[Callable[[GraphQLResolveInfo], Iterable[str]]]): For resolvers loading
+                only the selected fields of objects, lists the selection that is part of the key.
+
+        Returns:
+            Callable: The decorator.
+        """
+        key_arguments = key_arguments or {}
+        dependent_arguments = dependent_arguments or {}
+
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(root, info: GraphQLResolveInfo, **kwargs):
+                if any(kwargs.get(argument) for argument in bypass):
+                    return await func(root, info, **kwargs)
+                selection = (
+                    [str(field) for field in selected_fields(info, model)] if model is not None else []
+                )
+                if fields is not None:
+                    selection += fields(info)
+                key = self.key(info.field_name, kwargs, selection)
+                value = await self.backend.get(key)
+                if value is not _MISSING:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+                generation = self._generation
+                value = await func(root, info, **kwargs)
+                if generation == self._generation and not self._lagging(info):
+                    await self.backend.set(
+                        key, value, self.tags(entity, key_arguments, dependent_arguments, kwargs)
+                    )
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": getattr(self.backend, "evictions", None),
+            "size": self.backend.size(),
+        }
+
+
+result_cache = ResultCache(
+    (
+        RedisBackend(config.RESULT_CACHE_URL, config.RESULT_CACHE_TTL)
+        if config.RESULT_CACHE_URL
+        else MemoryBackend(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_TTL)
+    ),
+    replica_lag=config.READ_YOUR_WRITES_WINDOW,
+)
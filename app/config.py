@@ -1,7 +1,8 @@
-import logging
 import os
+from typing import Optional
 
 from dotenv import load_dotenv
+from logs import setup_logging
 from patisson_request.core import SelfAsyncService, Service
 
 root_path = os.path.join(os.path.dirname(__file__), "..")
@@ -12,17 +13,71 @@ SERVICE_NAME = Service.BOOKS.value
 SERVICE_HOST: str = os.getenv("SERVICE_HOST")  # type: ignore[reportArgumentType]
 
 DATABASE_URL: str = os.getenv("DATABASE_URL")  # type: ignore[reportArgumentType]
+DATABASE_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+DATABASE_READ_STRATEGY = os.getenv("DATABASE_READ_STRATEGY", "round_robin")
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", 5))
+REPLICA_RETRY_AFTER = float(os.getenv("REPLICA_RETRY_AFTER", 30))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", 10))
+COMPILED_CACHE_SIZE = int(os.getenv("COMPILED_CACHE_SIZE", 500))
+PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("PREPARED_STATEMENT_CACHE_SIZE", 500))
 
-file_handler = logging.FileHandler(os.path.join(root_path, f"{SERVICE_NAME}.log"))
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(
-    logging.Formatter(
-        "%(levelname)s | %(asctime)s | %(module)s | %(funcName)s | %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+INGESTION_TERM_TTL = float(os.getenv("INGESTION_TERM_TTL", 3600))
+INGESTION_MAX_TERMS = int(os.getenv("INGESTION_MAX_TERMS", 32))
+FILLING_BATCH_SIZE = int(os.getenv("FILLING_BATCH_SIZE", 200))
+FILLING_FLUSH_INTERVAL = float(os.getenv("FILLING_FLUSH_INTERVAL", 0.5))
+FILLING_WRITERS = int(os.getenv("FILLING_WRITERS", 4))
+FILLING_USERS_PAGE_SIZE = int(os.getenv("FILLING_USERS_PAGE_SIZE", 500))
+FILLING_REVIEWS_BATCH_SIZE = int(os.getenv("FILLING_REVIEWS_BATCH_SIZE", 1000))
+CRAWL_STALE_AFTER = float(os.getenv("CRAWL_STALE_AFTER", 30))
+CRAWL_MAX_TERMS = int(os.getenv("CRAWL_MAX_TERMS", 0))
+CRAWL_BATCH_TERMS = int(os.getenv("CRAWL_BATCH_TERMS", 50))
+
+GOOGLE_BOOKS_URL = os.getenv("GOOGLE_BOOKS_URL", "https://www.googleapis.com/books/v1/volumes")
+GOOGLE_BOOKS_API_KEY: Optional[str] = os.getenv("GOOGLE_BOOKS_API_KEY")
+GOOGLE_BOOKS_CONCURRENCY = int(os.getenv("GOOGLE_BOOKS_CONCURRENCY", 8))
+GOOGLE_BOOKS_RATE = float(os.getenv("GOOGLE_BOOKS_RATE", 10))
+GOOGLE_BOOKS_MAX_PAGES = int(os.getenv("GOOGLE_BOOKS_MAX_PAGES", 5))
+GOOGLE_BOOKS_RETRIES = int(os.getenv("GOOGLE_BOOKS_RETRIES", 4))
+GOOGLE_BOOKS_TIMEOUT = float(os.getenv("GOOGLE_BOOKS_TIMEOUT", 10))
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1024))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 60))
+RESULT_CACHE_URL: Optional[str] = os.getenv("RESULT_CACHE_URL")
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", 300))
+
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", 512))
+PERSISTED_QUERIES_PATH: Optional[str] = os.getenv("PERSISTED_QUERIES_PATH")
+PERSISTED_QUERIES_SIZE = int(os.getenv("PERSISTED_QUERIES_SIZE", 1000))
+
+QUERY_MAX_LIMIT = int(os.getenv("QUERY_MAX_LIMIT", 1000))
+QUERY_MAX_DEPTH = int(os.getenv("QUERY_MAX_DEPTH", 6))
+QUERY_NESTED_LIST_SIZE = int(os.getenv("QUERY_NESTED_LIST_SIZE", 20))
+QUERY_COST_BUDGET = int(os.getenv("QUERY_COST_BUDGET", 50000))
+QUERY_COST_BUDGETS = {
+    service.strip(): int(service_budget)
+    for service, _, service_budget in (
+        item.partition(":") for item in os.getenv("QUERY_COST_BUDGETS", "").split(",") if item.strip()
     )
-)
+}
+
+REVIEWS_BATCH_MAX_SIZE = int(os.getenv("REVIEWS_BATCH_MAX_SIZE", 100))
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
 
-logger = logging.getLogger(SERVICE_NAME)
-logger.addHandler(file_handler)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SQL_SAMPLE_RATE = float(os.getenv("LOG_SQL_SAMPLE_RATE", 0.01))
+LOG_ERROR_INTERVAL = float(os.getenv("LOG_ERROR_INTERVAL", 60))
+SQL_ECHO_LEVEL = os.getenv("SQL_ECHO_LEVEL", "OFF")
+
+logger, log_listener = setup_logging(
+    SERVICE_NAME,
+    os.path.join(root_path, f"{SERVICE_NAME}.log"),
+    level=LOG_LEVEL,
+    sql_level=SQL_ECHO_LEVEL,
+    error_interval=LOG_ERROR_INTERVAL,
+)
 
 
 SelfService = SelfAsyncService(
@@ -2,12 +2,30 @@ import asyncio
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from config import DATABASE_URL
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from config import COMPILED_CACHE_SIZE, DATABASE_URL, PREPARED_STATEMENT_CACHE_SIZE
+from db.statements import statement_stats
+from metrics import TimedQueuePool, watch_engine
+from sqlalchemy import Insert, Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+
+def create_engine(url: str) -> AsyncEngine:
+    """Create an engine with the compiled and prepared statement caches and their instrumentation."""
+    options = {}
+    if make_url(url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": PREPARED_STATEMENT_CACHE_SIZE}
+        options["poolclass"] = TimedQueuePool
+    engine = create_async_engine(url, future=True, query_cache_size=COMPILED_CACHE_SIZE, **options)
+    statement_stats.watch(engine)
+    watch_engine(engine)
+    return engine
+
+
+engine = create_engine(DATABASE_URL)
 Base = declarative_base()
 
 async_session = sessionmaker(  # type: ignore[reportCallIssue]
@@ -21,6 +39,16 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+def dialect_insert(session: AsyncSession, table: Table) -> Insert:
+    """Build an INSERT supporting ON CONFLICT clauses for the dialect of the session."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"ON CONFLICT inserts are not supported for the {dialect} dialect")
+
+
 def _db_init():
     async def create_tables():
         async with engine.begin() as conn:
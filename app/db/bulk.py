@@ -0,0 +1,34 @@
+"""
+This module bulk-loads rows into a table, for the offline database fillings and restores.
+
+Functions:
+    copy_rows: Writes rows with COPY on PostgreSQL (asyncpg) and a batched insert elsewhere.
+"""
+
+from sqlalchemy import Table, insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+async def copy_rows(conn: AsyncConnection, table: Table, rows: list[dict]) -> None:
+    """
+    Write rows to a table in the transaction of the connection.
+
+    Args:
+        conn (AsyncConnection): The connection, in a transaction.
+        table (Table): The target table.
+        rows (list[dict]): The rows, all with the same keys, which are the written columns.
+
+    Notes:
+        On asyncpg the rows are streamed with COPY, bypassing statement parsing and per-row
+        overhead; other databases get a multi-row insert.
+    """
+    if not rows:
+        return
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        columns = list(rows[0])
+        await raw.driver_connection.copy_records_to_table(  # type: ignore[union-attr]
+            table.name, records=[tuple(row[column] for column in columns) for row in rows], columns=columns
+        )
+    else:
+        await conn.execute(insert(table), rows)
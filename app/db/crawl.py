@@ -0,0 +1,167 @@
+"""
+This module maintains the crawl state of the search terms of the database filling.
+
+Every search term sent to Google Books has a `crawl_state` row recording when it was last
+crawled, the pages fetched and the books it found and inserted. A run only crawls the terms that
+are new, stale or whose last crawl was interrupted, most productive first, so its cost follows
+what changed rather than the size of the catalog. A term is marked as started before it is
+crawled and as crawled once its books are written, so an interrupted run resumes with the
+terms it did not finish.
+
+Classes:
+    TermStats: The outcome of the crawl of a term.
+    CrawlPlan: The terms to crawl in a run, the skipped ones and the outcome of the crawled ones.
+
+Functions:
+    plan_crawl: Selects and orders the terms to crawl.
+    start_crawl: Marks terms as being crawled.
+    record_crawl: Records the outcome of crawled terms.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+
+from db.base import dialect_insert
+from db.models import CrawlState
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+_table = CrawlState.__table__
+_CHUNK = 1000
+
+
+@dataclass
+class TermStats:
+    """The pages fetched and the books found and inserted by the crawl of a term."""
+
+    pages: int = 0
+    books_found: int = 0
+    books_inserted: int = 0
+
+
+@dataclass
+class CrawlPlan:
+    """The terms to crawl in priority order, the skipped terms with the reason and the outcome."""
+
+    terms: list[str] = field(default_factory=list)
+    skipped: dict[str, str] = field(default_factory=dict)
+    crawled: dict[str, TermStats] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        inserted = sum(stats.books_inserted for stats in self.crawled.values())
+        pages = sum(stats.pages for stats in self.crawled.values())
+        skipped = ", ".join(f"{term} ({reason})" for term, reason in self.skipped.items())
+        return (
+            f"crawled {len(self.crawled)} of {len(self.terms)} terms ({pages} pages, {inserted} new books), "
+            f"skipped {len(self.skipped)}: {skipped or '-'}"
+        )
+
+
+async def plan_crawl(
+    session: AsyncSession, terms: Sequence[str], stale_after: timedelta, limit: int = 0
+) -> CrawlPlan:
+    """
+    Select the terms to crawl.
+
+    Args:
+        session (AsyncSession): The session used for the reads.
+        terms (Sequence[str]): The candidate terms.
+        stale_after (timedelta): The age after which a crawled term is crawled again.
+        limit (int): The maximum number of terms to crawl; 0 means no limit.
+
+    Returns:
+        CrawlPlan: The terms to crawl and the skipped ones.
+
+    Notes:
+        New terms and the terms of an interrupted crawl come first, as nothing is known of
+        their yield. Stale terms follow by decreasing number of books inserted by their last
+        crawl, then from the oldest crawl.
+    """
+    cutoff = datetime.now(timezone.utc) - stale_after
+    states = {}
+    unique_terms = list(dict.fromkeys(terms))
+    for start in range(0, len(unique_terms), _CHUNK):
+        end = start + _CHUNK
+        result = await session.execute(
+            select(
+                CrawlState.term,
+                CrawlState.crawled_at,
+                CrawlState.books_inserted,
+                (CrawlState.crawled_at >= cutoff).label("fresh"),
+                (CrawlState.started_at > CrawlState.crawled_at).label("interrupted"),
+            ).where(CrawlState.term.in_(unique_terms[start:end]))
+        )
+        states.update({row.term: row for row in result})
+
+    plan = CrawlPlan()
+    unknown, stale = [], []
+    for term in unique_terms:
+        state = states.get(term)
+        if state is None or state.crawled_at is None or state.interrupted:
+            unknown.append(term)
+        elif state.fresh:
+            plan.skipped[term] = f"crawled at {state.crawled_at:%Y-%m-%d %H:%M}"
+        else:
+            stale.append(state)
+    stale.sort(key=lambda state: (-state.books_inserted, state.crawled_at))
+    ordered = unknown + [state.term for state in stale]
+    if limit and len(ordered) > limit:
+        plan.skipped.update({term: "run limit reached" for term in ordered[limit:]})
+        ordered = ordered[:limit]
+    plan.terms = ordered
+    return plan
+
+
+async def start_crawl(session: AsyncSession, terms: Sequence[str]) -> None:
+    """Mark terms as being crawled and commit."""
+    if not terms:
+        return
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(session, _table)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[_table.c.term], set_={"started_at": stmt.excluded.started_at}
+        ),
+        [{"term": term, "started_at": now} for term in terms],
+    )
+    await session.commit()
+
+
+async def record_crawl(session: AsyncSession, crawled: dict[str, TermStats]) -> None:
+    """
+    Record the outcome of crawled terms and commit.
+
+    Notes:
+        `pages`, `books_found` and `books_inserted` hold the outcome of the last crawl, which
+        is what the priority of the next one is based on; `crawls` counts them all.
+    """
+    if not crawled:
+        return
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(session, _table)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[_table.c.term],
+            set_={
+                "crawled_at": stmt.excluded.crawled_at,
+                "crawls": _table.c.crawls + 1,
+                "pages": stmt.excluded.pages,
+                "books_found": stmt.excluded.books_found,
+                "books_inserted": stmt.excluded.books_inserted,
+            },
+        ),
+        [
+            {
+                "term": term,
+                "started_at": now,
+                "crawled_at": now,
+                "crawls": 1,
+                "pages": stats.pages,
+                "books_found": stats.books_found,
+                "books_inserted": stats.books_inserted,
+            }
+            for term, stats in crawled.items()
+        ],
+    )
+    await session.commit()
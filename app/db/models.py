@@ -1,7 +1,23 @@
 from db.base import Base
 from patisson_request.errors import ValidateError
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Table, Text
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    Text,
+    event,
+    func,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG
 from sqlalchemy.orm import relationship, validates
+from sqlalchemy.sql import ColumnElement, literal_column
 from ulid import ULID
 
 
@@ -24,6 +40,34 @@ book_categories = Table(
 )
 
 
+SEARCH_CONFIG = "simple"
+
+
+def _search_vector(title: ColumnElement, description: ColumnElement) -> ColumnElement:
+    def weighted(column: ColumnElement, weight: str) -> ColumnElement:
+        return func.setweight(
+            func.to_tsvector(
+                literal_column(f"'{SEARCH_CONFIG}'", REGCONFIG), func.coalesce(column, literal_column("''"))
+            ),
+            literal_column(f"'{weight}'"),
+        )
+
+    return weighted(title, "A").op("||")(weighted(description, "B"))
+
+
+def _trigram_index(name: str, column: str) -> Index:
+    return Index(name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"}).ddl_if(
+        dialect="postgresql"
+    )
+
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
 class Book(Base):
     __tablename__ = "books"
 
@@ -39,23 +83,44 @@ class Book(Base):
     thumbnail = Column(String)
     language = Column(String, index=True)
 
-    authors = relationship("Author", secondary=book_authors, back_populates="books")
-    categories = relationship("Category", secondary=book_categories, back_populates="books")
+    authors = relationship("Author", secondary=book_authors, back_populates="books", order_by="Author.name")
+    categories = relationship(
+        "Category", secondary=book_categories, back_populates="books", order_by="Category.name"
+    )
     reviews = relationship("Review", back_populates="book")
 
+    __table_args__ = (
+        Index("ix_books_search", _search_vector(title, description), postgresql_using="gin").ddl_if(
+            dialect="postgresql"
+        ),
+        _trigram_index("ix_books_title_trgm", "title"),
+        _trigram_index("ix_books_description_trgm", "description"),
+    )
+
+
+def book_search_vector() -> ColumnElement:
+    """
+    Build the weighted full-text document of a book: the title ranks above the description.
+
+    Notes:
+        The expression is rendered with literal constants only, so the PostgreSQL planner
+        matches it against the `ix_books_search` GIN index.
+    """
+    return _search_vector(Book.title, Book.description)
+
 
 class Author(Base):
     __tablename__ = "authors"
 
     name = Column(String, primary_key=True)
-    books = relationship("Book", secondary=book_authors, back_populates="authors")
+    books = relationship("Book", secondary=book_authors, back_populates="authors", order_by="Book.id")
 
 
 class Category(Base):
     __tablename__ = "categories"
 
     name = Column(String, primary_key=True)
-    books = relationship("Book", secondary=book_categories, back_populates="categories")
+    books = relationship("Book", secondary=book_categories, back_populates="categories", order_by="Book.id")
 
 
 class Review(Base):
@@ -63,14 +128,57 @@ class Review(Base):
 
     id = Column(String, primary_key=True, default=ulid)
     user_id = Column(String, nullable=False, index=True)
-    book_id = Column(String, ForeignKey("books.id"), nullable=False)
+    book_id = Column(String, ForeignKey("books.id"), nullable=False, index=True)
     book = relationship("Book", back_populates="reviews")
     stars = Column(Integer, nullable=False)
     comment = Column(Text)
     actual = Column(Boolean, nullable=False, default=True)
 
+    __table_args__ = (
+        _trigram_index("ix_review_comment_trgm", "comment"),
+        # a user has at most one actual review per book
+        Index(
+            "uq_review_user_book_actual",
+            user_id,
+            book_id,
+            unique=True,
+            postgresql_where=actual,
+            sqlite_where=actual,
+        ),
+    )
+
     @validates("stars")
     def validate_stars(self, key, stars):
         if not (stars >= 1 and stars <= 5):
             raise ValidateError(f"Invalid number of stars ({stars})")
         return stars
+
+
+class BookRatingStats(Base):
+    __tablename__ = "book_rating_stats"
+
+    book_id = Column(String, ForeignKey("books.id"), primary_key=True)
+    reviews_count = Column(Integer, nullable=False, default=0)
+    stars_sum = Column(Integer, nullable=False, default=0)
+    stars_1 = Column(Integer, nullable=False, default=0)
+    stars_2 = Column(Integer, nullable=False, default=0)
+    stars_3 = Column(Integer, nullable=False, default=0)
+    stars_4 = Column(Integer, nullable=False, default=0)
+    stars_5 = Column(Integer, nullable=False, default=0)
+    average = Column(Float, index=True)
+
+    @property
+    def histogram(self) -> list[int]:
+        return [self.stars_1, self.stars_2, self.stars_3, self.stars_4, self.stars_5]
+
+
+class CrawlState(Base):
+    __tablename__ = "crawl_state"
+
+    term = Column(String, primary_key=True)
+    started_at = Column(DateTime(timezone=True))
+    crawled_at = Column(DateTime(timezone=True))
+    crawls = Column(Integer, nullable=False, default=0)
+    pages = Column(Integer, nullable=False, default=0)
+    books_found = Column(Integer, nullable=False, default=0)
+    books_inserted = Column(Integer, nullable=False, default=0)
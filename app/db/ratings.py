@@ -0,0 +1,122 @@
+"""
+This module maintains the per-book rating aggregates of the `book_rating_stats` table.
+
+Only actual reviews are counted. The review mutations apply their change to the aggregates in
+their own transaction through `record_rating`, or `record_ratings` for a batch of reviews, and
+`rebuild_rating_stats` recomputes the whole table from the reviews.
+
+Functions:
+    record_rating: Applies an added and/or removed star rating to the aggregates of a book.
+    record_ratings: Applies the rating changes of several books in one statement.
+    rebuild_rating_stats: Recomputes the aggregates of every book.
+"""
+
+from typing import Optional, Sequence
+
+from db.base import dialect_insert
+from db.models import BookRatingStats, Review
+from sqlalchemy import Float, case, cast, delete, func, insert, null
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+_table = BookRatingStats.__table__
+HISTOGRAM = ["stars_1", "stars_2", "stars_3", "stars_4", "stars_5"]
+
+
+def _average(stars_sum, reviews_count):
+    return case((reviews_count > 0, cast(stars_sum, Float) / reviews_count), else_=null())
+
+
+async def record_rating(
+    session: AsyncSession, book_id: str, added: Optional[int] = None, removed: Optional[int] = None
+) -> None:
+    """
+    Apply a rating change of a book to its aggregates, without committing.
+
+    Args:
+        session (AsyncSession): The session of the review mutation.
+        book_id (str): The reviewed book.
+        added (Optional[int]): The stars of the review that became actual.
+        removed (Optional[int]): The stars of the review that is no longer actual.
+
+    Notes:
+        The change is a single INSERT ... ON CONFLICT DO UPDATE incrementing the counters,
+        so concurrent reviews of the same book cannot lose updates.
+    """
+    await record_ratings(session, [(book_id, added, removed)])
+
+
+async def record_ratings(
+    session: AsyncSession, changes: Sequence[tuple[str, Optional[int], Optional[int]]]
+) -> None:
+    """
+    Apply the rating changes of several books to their aggregates in one statement, without committing.
+
+    Args:
+        session (AsyncSession): The session of the review mutation.
+        changes (Sequence[tuple[str, Optional[int], Optional[int]]]): The book, the added stars and
+            the removed stars of every change; a book appears at most once.
+    """
+    if not changes:
+        return
+    rows = []
+    for book_id, added, removed in changes:
+        deltas = {
+            "reviews_count": (added is not None) - (removed is not None),
+            "stars_sum": (added or 0) - (removed or 0),
+        }
+        for position, column in enumerate(HISTOGRAM, start=1):
+            deltas[column] = (added == position) - (removed == position)
+        average = deltas["stars_sum"] / deltas["reviews_count"] if deltas["reviews_count"] > 0 else None
+        rows.append({"book_id": book_id, "average": average, **deltas})
+
+    stmt = dialect_insert(session, _table)
+    counters = ["reviews_count", "stars_sum", *HISTOGRAM]
+    new_values = {column: _table.c[column] + stmt.excluded[column] for column in counters}
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[_table.c.book_id],
+            set_={
+                **new_values,
+                "average": _average(new_values["stars_sum"], new_values["reviews_count"]),
+            },
+        ),
+        rows,
+    )
+
+
+async def rebuild_rating_stats(session: AsyncSession) -> int:
+    """
+    Recompute the aggregates of every book from its actual reviews and commit.
+
+    Args:
+        session (AsyncSession): The session used for the rebuild.
+
+    Returns:
+        int: The number of books with at least one actual review.
+    """
+    reviews_count = func.count(Review.id)
+    stars_sum = func.sum(Review.stars)
+    aggregates = (
+        select(
+            Review.book_id,
+            reviews_count,
+            stars_sum,
+            *(func.sum(case((Review.stars == position, 1), else_=0)) for position in range(1, 6)),
+            _average(stars_sum, reviews_count),
+        )
+        .where(Review.actual.is_(True))
+        .group_by(Review.book_id)
+    )
+    try:
+        await session.execute(delete(_table))
+        result = await session.execute(
+            insert(_table).from_select(
+                ["book_id", "reviews_count", "stars_sum", *HISTOGRAM, "average"], aggregates
+            )
+        )
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return result.rowcount
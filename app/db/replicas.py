@@ -0,0 +1,178 @@
+"""
+This module routes read-only sessions to the read replicas configured in `DATABASE_READ_URLS`.
+
+Queries are served by a replica chosen round-robin or by the least number of open sessions,
+while mutations and the ingestion keep using the primary through `db.base.get_session`.
+A caller that has just written is served by the primary for `READ_YOUR_WRITES_WINDOW` seconds,
+so it reads its own writes despite the replication lag. A replica that cannot be reached is
+skipped until it passes a health check again; without a healthy replica, reads use the primary.
+
+Classes:
+    Replica: A replica engine with its session factory and usage state.
+    ReplicaPool: Selects replicas, tracks their health and the recent writers.
+
+Functions:
+    get_read_session: Opens a session for read-only work.
+
+Attributes:
+    replica_pool: The pool of the configured replicas.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
+
+import config
+from config import logger
+from db.base import create_engine, get_session
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+_CONNECTION_ERRORS = (OSError, TimeoutError, DBAPIError)
+
+
+class Replica:
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.session_factory = sessionmaker(  # type: ignore[reportCallIssue]
+            bind=engine, class_=AsyncSession, expire_on_commit=False  # type: ignore[reportArgumentType]
+        )
+        self.active = 0
+        self.unhealthy_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.unhealthy_until <= time.monotonic()
+
+
+class ReplicaPool:
+    """
+    Pool of read replicas.
+
+    Args:
+        engines (list[AsyncEngine]): The replica engines.
+        strategy (str): `round_robin` or `least_busy`.
+        retry_after (float): Seconds a failed replica is skipped before it is tried again.
+        read_your_writes_window (float): Seconds after a write during which the writer reads
+            from the primary.
+    """
+
+    def __init__(
+        self, engines: list[AsyncEngine], strategy: str, retry_after: float, read_your_writes_window: float
+    ) -> None:
+        if strategy not in ("round_robin", "least_busy"):
+            raise ValueError(f"unknown replica selection strategy: {strategy}")
+        self.replicas = [Replica(engine) for engine in engines]
+        self.strategy = strategy
+        self.retry_after = retry_after
+        self.read_your_writes_window = read_your_writes_window
+        self._cycle = itertools.cycle(self.replicas)
+        self._writes: dict[str, float] = {}
+
+    @staticmethod
+    def _writer_key(writer: str) -> str:
+        return hashlib.sha256(writer.encode()).hexdigest()
+
+    def record_write(self, writer: Optional[str]) -> None:
+        """Route the reads of the writer to the primary for the read-your-writes window."""
+        if not writer or not self.replicas:
+            return
+        now = time.monotonic()
+        if len(self._writes) > 10000:
+            self._writes = {
+                key: at for key, at in self._writes.items() if now - at < self.read_your_writes_window
+            }
+        self._writes[self._writer_key(writer)] = now
+
+    def wrote_recently(self, writer: Optional[str]) -> bool:
+        if not writer:
+            return False
+        written_at = self._writes.get(self._writer_key(writer))
+        return written_at is not None and time.monotonic() - written_at < self.read_your_writes_window
+
+    def choose(self) -> Optional[Replica]:
+        """Return a healthy replica, or None if there is none."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.strategy == "least_busy":
+            return min(healthy, key=lambda replica: replica.active)
+        for replica in self._cycle:
+            if replica.healthy:
+                return replica
+        return None
+
+    def mark_unhealthy(self, replica: Replica, error: BaseException) -> None:
+        replica.unhealthy_until = time.monotonic() + self.retry_after
+        logger.warning(f"read replica {replica.engine.url.host} is skipped for {self.retry_after}s: {error}")
+
+    async def check(self) -> None:
+        """Ping the replicas marked unhealthy and restore those that answer."""
+        for replica in self.replicas:
+            if replica.healthy:
+                continue
+            try:
+                async with replica.engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+            except _CONNECTION_ERRORS as e:
+                self.mark_unhealthy(replica, e)
+            else:
+                replica.unhealthy_until = 0.0
+
+    async def monitor(self, interval: float) -> None:
+        """Run `check` every `interval` seconds until the task is cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+
+replica_pool = ReplicaPool(
+    [create_engine(url) for url in config.DATABASE_READ_URLS],
+    strategy=config.DATABASE_READ_STRATEGY,
+    retry_after=config.REPLICA_RETRY_AFTER,
+    read_your_writes_window=config.READ_YOUR_WRITES_WINDOW,
+)
+
+
+@asynccontextmanager
+async def get_read_session(writer: Optional[str] = None) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Open a session for read-only work.
+
+    Args:
+        writer (Optional[str]): Identifies the caller for the read-your-writes window.
+
+    Yields:
+        AsyncSession: A session on a replica, or on the primary if the caller wrote recently
+            or no replica is reachable.
+
+    Notes:
+        The connection is checked out before the session is yielded, so an unreachable replica
+        is detected here and the session falls back to the primary. A replica session has
+        `replica` set in its `info`.
+    """
+    replica = None if replica_pool.wrote_recently(writer) else replica_pool.choose()
+    if replica is not None:
+        session: AsyncSession = replica.session_factory()
+        session.info["replica"] = True
+        try:
+            await session.connection()
+        except _CONNECTION_ERRORS as e:
+            replica_pool.mark_unhealthy(replica, e)
+            await session.close()
+        else:
+            replica.active += 1
+            try:
+                yield session
+            finally:
+                replica.active -= 1
+                await session.close()
+            return
+    async with get_session() as session:
+        yield session
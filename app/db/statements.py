@@ -0,0 +1,80 @@
+"""
+This module instruments the reuse of compiled SQL statements.
+
+SQLAlchemy caches the compiled form of a statement by its structure: the resolvers build their
+`Stmt` filter chains with bound parameters only, so requests with the same filter shape compile
+once and later executions only bind the new values. On asyncpg the compiled SQL is in turn
+prepared once per connection. The engines report the outcome of each execution to
+`statement_stats`.
+
+Classes:
+    StatementCacheStats: Counts the compiled cache hits and misses of the watched engines.
+
+Functions:
+    log_statement: Logs the SQL of a sample of the filter chains when INFO logging is enabled.
+
+Attributes:
+    statement_stats: The counters of the application engines.
+"""
+
+import logging
+import random
+
+from config import LOG_SQL_SAMPLE_RATE, logger
+from patisson_graphql.stmt_filter import Stmt
+from sqlalchemy import event
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class StatementCacheStats:
+    """
+    Counters of the compiled statement cache outcomes.
+
+    Notes:
+        A miss is expected once per statement shape and engine; a high miss ratio under a
+        steady load means a statement embeds its values instead of binding them.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    def watch(self, engine: AsyncEngine) -> None:
+        event.listen(engine.sync_engine, "after_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if context is None:
+            return
+        if context.cache_hit is CacheStats.CACHE_HIT:
+            self.hits += 1
+        elif context.cache_hit is CacheStats.CACHE_MISS:
+            self.misses += 1
+            logger.debug(f"compiled a new statement shape: {statement}")
+        else:
+            self.uncached += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached,
+            "hitRatio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def log_statement(stmt: Stmt) -> None:
+    """
+    Log the SQL of a filter chain, for the `LOG_SQL_SAMPLE_RATE` share of the calls.
+
+    Notes:
+        Rendering the SQL compiles the statement outside of the compiled cache, so it is
+        skipped unless the message would be emitted.
+    """
+    if logger.isEnabledFor(logging.INFO) and random.random() < LOG_SQL_SAMPLE_RATE:
+        logger.info(stmt.log())
+
+
+statement_stats = StatementCacheStats()
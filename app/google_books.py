@@ -0,0 +1,195 @@
+"""
+This module contains the client of the Google Books API used by the database filling.
+
+A single HTTP client with a connection pool, over HTTP/2 with the `httpx[http2]` dependency,
+serves every search term. Requests are bounded in concurrency and in rate by a token bucket,
+and are retried with a jittered exponential backoff on 429 and 5xx responses, on responses
+that are not JSON and on transport errors. Each search term is read page by page with
+`startIndex`/`maxResults` up to `GOOGLE_BOOKS_MAX_PAGES` pages, until `totalItems` is reached or
+a page comes back empty. The API key is sent with every request but never logged.
+
+Classes:
+    TokenBucket: An asyncio rate limiter.
+    GoogleBooksClient: Fetches the volumes matching a search term.
+
+Attributes:
+    google_books: The client shared by the application.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Optional
+
+import config
+import httpx
+from config import logger
+from metrics import GOOGLE_FETCH_DURATION
+
+try:  # httpx falls back to HTTP/1.1 where it is installed without the `http2` extra
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+PAGE_SIZE = 40  # the maximum `maxResults` accepted by the API
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate` acquisitions per second with bursts of up to `capacity`.
+
+    Args:
+        rate (float): The refill rate in tokens per second.
+        capacity (float): The maximum number of tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class GoogleBooksClient:
+    """
+    Client of the volumes search of the Google Books API.
+
+    Args:
+        url (str): The volumes endpoint; a local stub can be used for tests.
+        api_key (Optional[str]): The API key sent with each request, if any.
+        concurrency (int): The maximum number of requests in flight.
+        rate (float): The maximum number of requests per second.
+        max_pages (int): The maximum number of pages read per search term.
+        retries (int): The number of retries of a request after a 429, a 5xx or a transport error.
+        timeout (float): The timeout of a request in seconds.
+        transport (Optional[httpx.AsyncBaseTransport]): Replaces the network transport, for tests.
+
+    Notes:
+        The HTTP client is created on first use, so it belongs to the event loop running the
+        ingestion; `aclose` releases its connections.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: Optional[str],
+        concurrency: int,
+        rate: float,
+        max_pages: int,
+        retries: int,
+        timeout: float,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.url = url
+        self.api_key = api_key
+        self.max_pages = max_pages
+        self.retries = retries
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._transport = transport
+        self._bucket = TokenBucket(rate, capacity=max(rate, 1))
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2 and self._transport is None,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None and (retry_after := response.headers.get("Retry-After", "")).isdigit():
+            return float(retry_after)
+        return random.uniform(0, min(30.0, 0.5 * 2**attempt))
+
+    async def _get(self, params: dict[str, Any]) -> Optional[dict]:
+        # the API key is sent with the request but kept out of `params`, which are logged
+        query = {**params, "key": self.api_key} if self.api_key else params
+        for attempt in range(self.retries + 1):
+            response: Optional[httpx.Response] = None
+            await self._bucket.acquire()
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await self.client.get(self.url, params=query)
+                except httpx.TransportError as e:
+                    error = repr(e)
+                else:
+                    error = f"status {response.status_code}"
+                finally:
+                    GOOGLE_FETCH_DURATION.observe(time.perf_counter() - started)
+            if response is not None:
+                if response.status_code == 200:
+                    try:
+                        return response.json()
+                    except ValueError:
+                        error = "a response body that is not JSON"
+                elif response.status_code != 429 and response.status_code < 500:
+                    logger.warning(
+                        f"Google Books request {params} failed with {error}: {response.text[:200]}"
+                    )
+                    return None
+            if attempt < self.retries:
+                await asyncio.sleep(self._backoff(attempt, response))
+        logger.warning(f"Google Books request {params} failed after {self.retries + 1} attempts: {error}")
+        return None
+
+    async def volumes(self, query: str) -> AsyncIterator[list[dict]]:
+        """
+        Fetch the volumes matching a search term.
+
+        Args:
+            query (str): The search term.
+
+        Yields:
+            list[dict]: The volumes of each page, as returned by the API.
+        """
+        for page in range(self.max_pages):
+            start = page * PAGE_SIZE
+            result = await self._get({"q": query, "startIndex": start, "maxResults": PAGE_SIZE})
+            if result is None:
+                return
+            items = result.get("items", [])
+            if not items:
+                return
+            yield items
+            # short pages are common before the last one, so only `totalItems` ends the search
+            if start + PAGE_SIZE >= result.get("totalItems", 0):
+                return
+
+
+google_books = GoogleBooksClient(
+    config.GOOGLE_BOOKS_URL,
+    config.GOOGLE_BOOKS_API_KEY,
+    concurrency=config.GOOGLE_BOOKS_CONCURRENCY,
+    rate=config.GOOGLE_BOOKS_RATE,
+    max_pages=config.GOOGLE_BOOKS_MAX_PAGES,
+    retries=config.GOOGLE_BOOKS_RETRIES,
+    timeout=config.GOOGLE_BOOKS_TIMEOUT,
+)
@@ -0,0 +1,143 @@
+"""
+This module contains the background ingestion of Google Books search terms.
+
+Resolvers only enqueue the terms of the `search` argument; a single worker started in the
+application lifespan fetches them with `filling_db` outside of the request path.
+
+Classes:
+    IngestionWorker: Deduplicates search terms and ingests them in the background.
+
+Attributes:
+    ingestion_worker: The worker shared by the application.
+"""
+
+import asyncio
+import time
+from typing import Iterable, Optional
+
+import config
+from _db_filling import filling_db
+from config import logger
+
+
+class IngestionWorker:
+    """
+    Queue of search terms waiting to be ingested into the database.
+
+    Args:
+        term_ttl (float): Seconds during which a successfully ingested term is not fetched again.
+        max_terms (int): The maximum number of terms passed to one `filling_db` call.
+
+    Notes:
+        A term is enqueued at most once while it is queued or being ingested; callers asking for
+        the same term share its completion event.
+    """
+
+    def __init__(self, term_ttl: float, max_terms: int) -> None:
+        self.term_ttl = term_ttl
+        self.max_terms = max_terms
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._in_flight: dict[str, asyncio.Event] = {}
+        self._enqueued_at: dict[str, float] = {}
+        self._recent: dict[str, float] = {}
+        self._ingested = 0
+        self._failed = 0
+        self._last_batch_duration: Optional[float] = None
+
+    def _is_recent(self, term: str, now: float) -> bool:
+        ingested_at = self._recent.get(term)
+        return ingested_at is not None and now - ingested_at < self.term_ttl
+
+    def enqueue(self, terms: Iterable[str]) -> list[asyncio.Event]:
+        """
+        Enqueue the terms that are neither in flight nor recently ingested.
+
+        Args:
+            terms (Iterable[str]): The search terms.
+
+        Returns:
+            list[asyncio.Event]: The completion events of the terms still to be ingested.
+        """
+        now = time.monotonic()
+        events = []
+        for term in {raw.strip() for raw in terms}:
+            if not term or self._is_recent(term, now):
+                continue
+            if (event := self._in_flight.get(term)) is None:
+                event = self._in_flight[term] = asyncio.Event()
+                self._enqueued_at[term] = now
+                self._queue.put_nowait(term)
+            events.append(event)
+        return events
+
+    async def submit(self, terms: Iterable[str], wait_ms: Optional[int] = None) -> None:
+        """
+        Enqueue the terms and optionally wait for their ingestion.
+
+        Args:
+            terms (Iterable[str]): The search terms.
+            wait_ms (Optional[int]): The maximum time in milliseconds to wait for the terms to be
+                ingested. The request is not delayed if it is not set.
+        """
+        events = self.enqueue(terms)
+        if not events or not wait_ms or wait_ms <= 0:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(event.wait() for event in events)), wait_ms / 1000)
+        except TimeoutError:
+            logger.info(f"search terms were not ingested within {wait_ms} ms")
+
+    def _forget_expired(self, now: float) -> None:
+        for term in [term for term in self._recent if not self._is_recent(term, now)]:
+            del self._recent[term]
+
+    async def run(self) -> None:
+        """Ingest enqueued terms until the task is cancelled."""
+        while True:
+            terms = [await self._queue.get()]
+            while len(terms) < self.max_terms and not self._queue.empty():
+                terms.append(self._queue.get_nowait())
+            for term in terms:
+                del self._enqueued_at[term]
+
+            started = time.monotonic()
+            try:
+                await filling_db(terms)
+            except Exception:
+                self._failed += len(terms)
+                logger.exception(f"ingestion of {len(terms)} search terms failed")
+            else:
+                self._ingested += len(terms)
+                now = time.monotonic()
+                self._forget_expired(now)
+                for term in terms:
+                    self._recent[term] = now
+            finally:
+                self._last_batch_duration = time.monotonic() - started
+                for term in terms:
+                    self._in_flight.pop(term).set()
+
+    def status(self) -> dict:
+        """
+        Return the state of the ingestion queue.
+
+        Returns:
+            dict: The queue depth, the number of terms in flight, the age of the oldest queued
+                term, the last batch duration and the totals of ingested and failed terms.
+        """
+        now = time.monotonic()
+        oldest = next(iter(self._enqueued_at.values()), None)
+        return {
+            "queueDepth": self._queue.qsize(),
+            "inFlight": len(self._in_flight),
+            "lagMs": round((now - oldest) * 1000) if oldest is not None else 0,
+            "lastBatchMs": (
+                round(self._last_batch_duration * 1000) if self._last_batch_duration is not None else None
+            ),
+            "recentTerms": sum(self._is_recent(term, now) for term in self._recent),
+            "ingestedTerms": self._ingested,
+            "failedTerms": self._failed,
+        }
+
+
+ingestion_worker = IngestionWorker(term_ttl=config.INGESTION_TERM_TTL, max_terms=config.INGESTION_MAX_TERMS)
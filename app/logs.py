@@ -0,0 +1,94 @@
+"""
+This module contains the logging pipeline of the service.
+
+Records are put on a queue by the calling thread and written to the log file by a background
+thread, so logging never blocks the event loop on disk writes. Warnings and errors repeated from
+the same line are written at most once per interval, with the number of suppressed repetitions.
+
+Classes:
+    RateLimitFilter: Limits the records of WARNING level and above per logging call site.
+
+Functions:
+    setup_logging: Routes a logger and the SQLAlchemy engine logs through a queue to a file.
+"""
+
+import atexit
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through one record of WARNING level and above per call site and interval.
+
+    Args:
+        interval (float): Seconds during which repetitions of a call site are suppressed.
+    """
+
+    def __init__(self, interval: float) -> None:
+        super().__init__()
+        self.interval = interval
+        self._last: dict[tuple[str, int], float] = {}
+        self._suppressed: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.interval <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        if now - self._last.get(site, -self.interval) < self.interval:
+            self._suppressed[site] = self._suppressed.get(site, 0) + 1
+            return False
+        self._last[site] = now
+        if suppressed := self._suppressed.pop(site, 0):
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+def setup_logging(
+    name: str, path: str, level: str, sql_level: str, error_interval: float
+) -> tuple[logging.Logger, QueueListener]:
+    """
+    Configure the service logger and the SQL echo.
+
+    Args:
+        name (str): The name of the service logger.
+        path (str): The log file.
+        level (str): The level of the service logger.
+        sql_level (str): The level of the `sqlalchemy.engine` logger: `INFO` logs the statements,
+            `DEBUG` also logs the result rows, `OFF` disables the SQL echo.
+        error_interval (float): Seconds between two warnings or errors of the same call site.
+
+    Returns:
+        tuple[logging.Logger, QueueListener]: The service logger and the started listener
+            writing the queued records; it is stopped, flushing the queue, at exit.
+    """
+    file_handler = logging.FileHandler(path)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(
+        logging.Formatter(
+            "%(levelname)s | %(asctime)s | %(module)s | %(funcName)s | %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    )
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter(error_interval))
+    listener = QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level.upper())
+    logger.addHandler(queue_handler)
+
+    sql_logger = logging.getLogger("sqlalchemy.engine")
+    if sql_level.upper() == "OFF":
+        sql_logger.setLevel(logging.WARNING)
+    else:
+        sql_logger.setLevel(sql_level.upper())
+    sql_logger.addHandler(queue_handler)
+    return logger, listener
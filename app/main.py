@@ -1,20 +1,34 @@
 import asyncio
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 import config
 from api import router
+from api.graphql.documents import persisted_queries
 from api.graphql.resolvers import resolvers
+from api.graphql.route import create_graphql_route
 from db.base import get_session
+from db.replicas import get_read_session, replica_pool
 from fastapi import FastAPI
+from google_books import google_books
+from ingestion import ingestion_worker
 from patisson_appLauncher.fastapi_app_launcher import UvicornFastapiAppLauncher
-from patisson_graphql.framework_utils.fastapi import create_graphql_route
 from patisson_request.service_routes import BooksRoute
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if config.PERSISTED_QUERIES_PATH:
+        persisted_queries.load(config.PERSISTED_QUERIES_PATH)
     task = asyncio.create_task(config.SelfService.tokens_update_task())
+    ingestion_task = asyncio.create_task(ingestion_worker.run())
+    replicas_task = asyncio.create_task(replica_pool.monitor(config.REPLICA_CHECK_INTERVAL))
     yield
+    for background_task in (replicas_task, ingestion_task):
+        background_task.cancel()
+        # let an in-flight ingestion batch roll back and close its session before the loop stops
+        with suppress(asyncio.CancelledError):
+            await background_task
+    await google_books.aclose()
     task.cancel()
     await task
 
@@ -23,16 +37,21 @@ app = FastAPI(title=config.SERVICE_NAME, lifespan=lifespan)
 
 if __name__ == "__main__":
     health_path = f"/{config.SERVICE_NAME}/{BooksRoute.health().path}"
+    metrics_path = f"/{config.SERVICE_NAME}/metrics"
 
     app_launcher = UvicornFastapiAppLauncher(
         app, router, service_name=config.SERVICE_NAME, host=config.SERVICE_HOST
     )
-    app_launcher.add_token_middleware(config.SelfService.get_access_token, excluded_paths=[health_path])
+    app_launcher.add_token_middleware(
+        config.SelfService.get_access_token, excluded_paths=[health_path, metrics_path]
+    )
     app_launcher.add_sync_consul_health_path()
     app_launcher.consul_register(check_path=health_path)
     app_launcher.add_jaeger()
     app_launcher.add_route(
-        path="/graphql", endpoint=create_graphql_route(resolvers, get_session), methods=["POST"]
+        path="/graphql",
+        endpoint=create_graphql_route(resolvers, get_session, get_read_session, replica_pool.record_write),
+        methods=["POST"],
     )
     app_launcher.include_router(prefix=f"/{config.SERVICE_NAME}")
     app_launcher.app_run()
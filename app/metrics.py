@@ -0,0 +1,316 @@
+"""
+This module contains the metrics of the service, exposed in the Prometheus text format.
+
+Recording a sample is a dictionary lookup and an addition on the calling thread; everything that
+can be read from existing state instead, such as the pool usage, is collected at scrape time.
+
+Classes:
+    Counter: A monotonically increasing value per label set.
+    Gauge: A value per label set that can go up and down.
+    Histogram: The distribution of observed values per label set, in cumulative buckets.
+    Registry: Holds the metrics and renders them.
+    TimedQueuePool: An asyncio connection pool recording the time spent waiting for a connection.
+
+Functions:
+    instrument_schema: Records the latency, errors and returned items of the root resolvers of a schema.
+    resolver_label: Returns the resolver label of the statements of an operation.
+    watch_engine: Records the execute time and the rows of the statements and the pool usage of an engine.
+
+Attributes:
+    registry: The registry rendered by the `/metrics` endpoint.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from inspect import isawaitable
+from typing import Any, Callable, Optional, Sequence
+
+from graphql import GraphQLSchema
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ITEMS_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 1000)
+
+current_resolver: ContextVar[str] = ContextVar("current_resolver", default="")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[labelvalues] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = (*buckets, float("inf"))
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        state = self._values.get(labelvalues)
+        if state is None:
+            state = self._values[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{float(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Holds the metrics and the collectors refreshing gauges at scrape time.
+
+    Notes:
+        A collector is a callable run before each rendering, to set gauges from state that is
+        cheaper to read on demand than to track on every change.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: list[Any] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: Any) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+RESOLVER_DURATION = registry.register(
+    Histogram("books_resolver_duration_seconds", "Latency of the root GraphQL resolvers.", ["resolver"])
+)
+RESOLVER_ERRORS = registry.register(
+    Counter("books_resolver_errors_total", "Root GraphQL resolver calls that raised.", ["resolver"])
+)
+RESOLVER_ITEMS = registry.register(
+    Histogram(
+        "books_resolver_items", "Items returned by the root GraphQL resolvers.", ["resolver"], ITEMS_BUCKETS
+    )
+)
+DB_EXECUTE_DURATION = registry.register(
+    Histogram(
+        "books_db_execute_duration_seconds", "Execute time of the SQL statements per resolver.", ["resolver"]
+    )
+)
+DB_ROWS = registry.register(
+    Histogram(
+        "books_db_rows",
+        "Rows returned or affected by the SQL statements per resolver.",
+        ["resolver"],
+        ITEMS_BUCKETS,
+    )
+)
+DB_POOL_WAIT = registry.register(
+    Histogram("books_db_pool_wait_seconds", "Time spent waiting for a pooled connection.", ["database"])
+)
+DB_POOL_CHECKED_OUT = registry.register(
+    Gauge("books_db_pool_checked_out", "Connections currently checked out of the pool.", ["database"])
+)
+DB_POOL_SATURATION = registry.register(
+    Gauge(
+        "books_db_pool_saturation",
+        "Checked out connections over the pool size; above 1 overflow connections are in use.",
+        ["database"],
+    )
+)
+FILLING_QUEUE_DEPTH = registry.register(
+    Gauge("books_filling_queue_depth", "Volumes fetched from Google Books and waiting to be written.")
+)
+GOOGLE_FETCH_DURATION = registry.register(
+    Histogram("books_google_fetch_duration_seconds", "Latency of the Google Books API requests.")
+)
+BOOKS_INSERTED = registry.register(
+    Counter("books_inserted_total", "Books inserted by the ingestion; rate() gives the books per second.")
+)
+
+
+def _items(result: Any) -> Optional[int]:
+    if isinstance(result, dict):
+        result = result.get("items")
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+def _timed(name: str, resolve: Callable) -> Callable:
+    async def resolver(root: Any, info: Any, **kwargs) -> Any:
+        started = time.perf_counter()
+        try:
+            result = resolve(root, info, **kwargs)
+            if isawaitable(result):
+                result = await result
+        except Exception:
+            RESOLVER_ERRORS.inc(name)
+            raise
+        finally:
+            RESOLVER_DURATION.observe(time.perf_counter() - started, name)
+        if (items := _items(result)) is not None:
+            RESOLVER_ITEMS.observe(items, name)
+        return result
+
+    return resolver
+
+
+def resolver_label(root_fields: Sequence[str]) -> str:
+    """
+    Return the resolver label of the statements of an operation from the names of its root fields.
+
+    Notes:
+        Operations selecting several root fields are labelled "multiple", so the label set stays
+        bounded whatever the clients combine.
+    """
+    names = set(root_fields) - {"__typename"}
+    if len(names) > 1:
+        return "multiple"
+    return next(iter(names), "")
+
+
+def instrument_schema(schema: GraphQLSchema) -> None:
+    """
+    Wrap the resolvers of the query and mutation fields with the resolver metrics.
+
+    Notes:
+        Only the root fields are wrapped, so the nested fields resolved for every returned item
+        run without instrumentation. The statements are attributed through `current_resolver`,
+        which the GraphQL route sets for the whole operation with `resolver_label`: the nested
+        fields and the loader batches run after the root resolver has returned.
+    """
+    for root_type in (schema.query_type, schema.mutation_type):
+        if root_type is None:
+            continue
+        for name, field in root_type.fields.items():
+            if field.resolve is not None:
+                field.resolve = _timed(name, field.resolve)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    label = ""
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started, self.label)
+
+    def recreate(self) -> "TimedQueuePool":
+        pool = super().recreate()
+        pool.label = self.label
+        return pool  # type: ignore[reportReturnType]
+
+
+def _rows(cursor: Any, context: Any) -> Optional[int]:
+    if cursor.description is None:
+        return cursor.rowcount if cursor.rowcount >= 0 else None
+    if context is not None and context.execution_options.get("stream_results"):
+        return None  # fetched later, batch by batch
+    # the asyncio adapters buffer the whole result of a client-side cursor when executing
+    if (rows := getattr(cursor, "_rows", None)) is not None:
+        return len(rows)
+    return cursor.rowcount if cursor.rowcount >= 0 else None
+
+
+def watch_engine(engine: AsyncEngine) -> None:
+    """
+    Record the statement execute time and rows and the pool usage of an engine.
+
+    Notes:
+        The rows of a query are those it returns, unless they are streamed with a server-side
+        cursor; the rows of other statements are those the driver reports as affected.
+    """
+    label = engine.url.host or engine.url.database or "default"
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.label = label
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info["metrics_started"].pop()
+        resolver = current_resolver.get() or "other"
+        DB_EXECUTE_DURATION.observe(time.perf_counter() - started, resolver)
+        if (rows := _rows(cursor, context)) is not None:
+            DB_ROWS.observe(rows, resolver)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(exception_context) -> None:
+        if exception_context.connection is not None:
+            started = exception_context.connection.info.get("metrics_started")
+            if started:
+                started.pop()
+
+    def collect_pool() -> None:
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            checked_out = pool.checkedout()
+            DB_POOL_CHECKED_OUT.set(checked_out, label)
+            DB_POOL_SATURATION.set(checked_out / pool.size() if pool.size() else 0, label)
+
+    registry.add_collector(collect_pool)
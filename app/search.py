@@ -0,0 +1,147 @@
+"""
+This module contains the relevance-ranked full-text search over book titles and descriptions.
+
+On PostgreSQL the search runs against the `ix_books_search` GIN index and is ranked with
+`ts_rank_cd`. Other dialects (SQLite in local runs and tests) fall back to an in-process
+inverted index ranked with BM25.
+
+Classes:
+    InvertedIndex: A pure-Python inverted index of the books.
+
+Functions:
+    rank_books: Restricts a books statement to the matches of a text, ordered by relevance.
+
+Attributes:
+    text_index: The inverted index shared by the application.
+"""
+
+import asyncio
+import math
+import re
+from collections import defaultdict
+from typing import Optional
+
+from db.models import SEARCH_CONFIG, Book, book_search_vector
+from sqlalchemy import Select, case, func
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import literal_column
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+class InvertedIndex:
+    """
+    Inverted index of book titles and descriptions ranked with BM25.
+
+    Args:
+        title_weight (int): How many times a title token counts compared to a description token.
+        k1 (float): The BM25 term frequency saturation.
+        b (float): The BM25 document length normalization.
+
+    Notes:
+        The index is filled from the database on first use and kept up to date by the ingestion
+        through `add`. Like the PostgreSQL search, a book matches only if it contains every token.
+    """
+
+    def __init__(self, title_weight: int = 2, k1: float = 1.2, b: float = 0.75) -> None:
+        self.title_weight = title_weight
+        self.k1 = k1
+        self.b = b
+        self.built = False
+        self._postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self._lengths: dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    def add(self, book_id: str, title: Optional[str], description: Optional[str]) -> None:
+        tokens = tokenize(title) * self.title_weight + tokenize(description)
+        self._lengths[book_id] = len(tokens)
+        for token in tokens:
+            postings = self._postings[token]
+            postings[book_id] = postings.get(book_id, 0) + 1
+
+    async def ensure(self, session: AsyncSession) -> None:
+        """Fill the index from the database if it has not been built yet."""
+        async with self._lock:
+            if self.built:
+                return
+            result = await session.execute(select(Book.id, Book.title, Book.description))
+            for book_id, title, description in result:
+                self.add(book_id, title, description)
+            self.built = True
+
+    def search(self, text: str) -> dict[str, float]:
+        """
+        Find the books containing every token of the text.
+
+        Args:
+            text (str): The search text.
+
+        Returns:
+            dict[str, float]: The BM25 score of each matching book id.
+        """
+        tokens = set(tokenize(text))
+        if not tokens or any(token not in self._postings for token in tokens):
+            return {}
+        postings = sorted((self._postings[token] for token in tokens), key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        total = len(self._lengths)
+        average_length = sum(self._lengths.values()) / total
+        scores = {}
+        for book_id in matches:
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[book_id] / average_length)
+            score = 0.0
+            for docs in postings:
+                idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+                tf = docs[book_id]
+                score += idf * tf * (self.k1 + 1) / (tf + norm)
+            scores[book_id] = score
+        return scores
+
+
+text_index = InvertedIndex()
+
+
+async def rank_books(
+    session: AsyncSession, stmt: Select, text: str, offset: Optional[int], limit: Optional[int]
+) -> Select:
+    """
+    Restrict a filtered books statement to the books matching the text, most relevant first.
+
+    Args:
+        session (AsyncSession): The session the statement will be executed with.
+        stmt (Select): The filtered statement, without ordering and paging.
+        text (str): The search text, in the web search syntax on PostgreSQL.
+        offset (Optional[int]): The number of matches to skip.
+        limit (Optional[int]): The maximum number of matches.
+
+    Returns:
+        Select: The statement returning one page of matches ordered by relevance.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        vector = book_search_vector()
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'", REGCONFIG), text)
+        return (
+            stmt.where(vector.bool_op("@@")(tsquery))
+            .order_by(func.ts_rank_cd(vector, tsquery).desc(), Book.id)
+            .offset(offset)
+            .limit(limit)
+        )
+
+    await text_index.ensure(session)
+    scores = text_index.search(text)
+    result = await session.execute(stmt.with_only_columns(Book.id).where(Book.id.in_(list(scores))))
+    ranked = sorted(result.scalars(), key=lambda book_id: (-scores[book_id], book_id))
+    start = offset or 0
+    end = start + limit if limit is not None else None
+    page = ranked[start:end]
+    if not page:
+        return stmt.where(Book.id.in_([]))
+    return stmt.where(Book.id.in_(page)).order_by(
+        case({book_id: position for position, book_id in enumerate(page)}, value=Book.id)
+    )
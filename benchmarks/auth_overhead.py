@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the per-request token verification overhead of `verify_tokens_decorator`.
+
+"before" reproduces the previous behaviour: the resolver signature is inspected and both tokens
+are verified on every call. "after" is the current decorator with the verified-token caches.
+JWT verification is replaced by an HS256 signature check of comparable cost, so the benchmark
+runs without the authentication service.
+
+Usage:
+    python benchmarks/auth_overhead.py [iterations]
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import inspect
+import json
+import os
+import sys
+import time
+from functools import wraps
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from api.graphql import deps  # noqa: E402
+
+SECRET = b"benchmark"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def make_token(sub: str) -> str:
+    header = _b64(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    payload = _b64(json.dumps({"sub": sub, "exp": time.time() + 3600}).encode())
+    signature = _b64(hmac.new(SECRET, f"{header}.{payload}".encode(), hashlib.sha256).digest())
+    return f"{header}.{payload}.{signature}"
+
+
+async def verify_hs256(self_service, access_token: str) -> SimpleNamespace:
+    header, payload, signature = access_token.split(".")
+    expected = _b64(hmac.new(SECRET, f"{header}.{payload}".encode(), hashlib.sha256).digest())
+    if not hmac.compare_digest(expected, signature):
+        raise ValueError("invalid signature")
+    return SimpleNamespace(**json.loads(base64.urlsafe_b64decode(payload + "==")))
+
+
+def legacy_verify_tokens_decorator(func):
+    @wraps(func)
+    async def wrapper(root, info, **kwargs):
+        func_signature_arguments = [param.name for param in inspect.signature(func).parameters.values()]
+        func_kwargs = {}
+        if (service := "service_token") in func_signature_arguments:
+            deps.service_token_cache.flush()
+            func_kwargs[service] = await deps.verify_service_token(info.context)
+        if (user := "client_token") in func_signature_arguments:
+            deps.client_token_cache.flush()
+            func_kwargs[user] = await deps.verify_client_token(info.context)
+        return await func(root, info, **func_kwargs, **kwargs)
+
+    return wrapper
+
+
+async def resolver(_, info, service_token, client_token, book_id: str, stars: int, comment=None):
+    return None
+
+
+async def measure(wrapped, info, iterations: int) -> float:
+    for _ in range(min(iterations, 1000)):
+        await wrapped(None, info, book_id="book", stars=5)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await wrapped(None, info, book_id="book", stars=5)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main(iterations: int) -> None:
+    deps.verify_service_token_dep = verify_hs256
+    deps.verify_client_token_dep = verify_hs256
+    headers = {
+        "Authorization": f"Bearer {make_token('service')}",
+        "X-Client-Token": make_token("user"),
+    }
+    info = SimpleNamespace(context=SimpleNamespace(request=SimpleNamespace(headers=headers)))
+
+    before = await measure(legacy_verify_tokens_decorator(resolver), info, iterations)
+    after = await measure(deps.verify_tokens_decorator(resolver), info, iterations)
+    print(f"iterations: {iterations}")
+    print(f"before: {before:8.2f} us/request")
+    print(f"after:  {after:8.2f} us/request ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -0,0 +1,316 @@
+"""
+Load and latency benchmark of the GraphQL API.
+
+The benchmark seeds a database at the requested scale, then replays a weighted mix of the
+`books`, `booksDeep`, `authors` and `reviewsDeep` queries and of the review mutations through the
+ASGI application in-process. It reports the throughput, the p50/p95/p99 latencies and the number
+of database round trips per request for every operation. Token verification is replaced by a
+stub accepting any token, so neither the authentication service nor the network is involved.
+
+The database is seeded by the synthetic catalog generator of `app/_synthetic_filling.py`. The
+data is derived from `--seed` only, so two runs at the same scale replay the same requests
+against the same rows. The results are written as JSON; `--compare` prints the change
+against an earlier result file and fails if a p99 latency regressed by more than `--threshold`.
+
+Usage:
+    python benchmarks/load.py --books 10000 --reviews 100000
+    python benchmarks/load.py --database-url postgresql+asyncpg://... --books 1000000 --reviews 10000000
+    python benchmarks/load.py --compare benchmarks/results/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+WORDS = "world life time people house money story music power water family school".split()
+
+QUERIES: dict[str, tuple[int, str]] = {
+    "books": (
+        30,
+        "query($offset: Int, $like: String) "
+        "{ books(offset: $offset, limit: 20, like_title: $like) { id title publisher language } }",
+    ),
+    "booksDeep": (
+        20,
+        "query($ids: [ID]) { booksDeep(ids: $ids) "
+        "{ id title authors { name } categories { name } rating { count average } } }",
+    ),
+    "authors": (
+        15,
+        "query($offset: Int) { authors(offset: $offset, limit: 20) { name books { id title } } }",
+    ),
+    "reviewsDeep": (
+        20,
+        "query($books: [String]) "
+        "{ reviewsDeep(books: $books, limit: 20) { id stars comment book { id title } } }",
+    ),
+    "createReview": (
+        7,
+        'mutation($book: ID!, $stars: Int!) { createReview(book_id: $book, stars: $stars, comment: "load") '
+        "{ success } }",
+    ),
+    "updateReview": (
+        5,
+        "mutation($book: ID!, $stars: Int!) { updateReview(book_id: $book, stars: $stars) { success } }",
+    ),
+    "deleteReview": (3, "mutation($book: ID!) { deleteReview(book_id: $book) { success } }"),
+}
+
+
+def scale(args: argparse.Namespace) -> Any:
+    from _synthetic_filling import Scale
+
+    return Scale(args.books, args.reviews, args.seed)
+
+
+round_trips: ContextVar[Optional[list[int]]] = ContextVar("round_trips", default=None)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--database-url", help="defaults to a SQLite file in the temporary directory (requires aiosqlite)"
+    )
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--reviews", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000, help="clients sending the review mutations")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reseed", action="store_true", help="drop and seed the database again")
+    parser.add_argument("--output", help="defaults to benchmarks/results/load-<timestamp>.json")
+    parser.add_argument("--compare", help="an earlier result file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="tolerated relative p99 regression")
+    return parser.parse_args()
+
+
+async def seed(args: argparse.Namespace) -> None:
+    from _synthetic_filling import generate
+    from db.base import Base, engine, get_session
+    from db.models import Book
+    from sqlalchemy import func, select
+
+    async with engine.begin() as conn:
+        if args.reseed:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with get_session() as session:
+        existing = await session.scalar(select(func.count()).select_from(Book))
+    if existing == args.books:
+        return
+    if existing:
+        sys.exit(f"the database holds {existing} books instead of {args.books}; run with --reseed")
+    print(f"seeding {args.books} books and {args.reviews} reviews...", flush=True)
+    started = time.perf_counter()
+    await generate(scale(args))
+    print(f"seeded in {time.perf_counter() - started:.1f}s", flush=True)
+
+
+def stub_token_verification() -> None:
+    from api.graphql import deps
+
+    async def verify(self_service: Any, access_token: str) -> SimpleNamespace:
+        return SimpleNamespace(sub=access_token, exp=None)
+
+    deps.verify_service_token_dep = verify
+    deps.verify_client_token_dep = verify
+
+
+def count_round_trips() -> None:
+    from db.base import engine
+    from sqlalchemy import event
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        if (counter := round_trips.get()) is not None:
+            counter[0] += 1
+
+
+def next_request(rng: random.Random, args: argparse.Namespace) -> tuple[str, dict, str]:
+    from _synthetic_filling import book_id
+
+    dataset = scale(args)
+    operation = rng.choices(list(QUERIES), weights=[weight for weight, _ in QUERIES.values()])[0]
+    book = book_id(dataset, int(args.books * rng.random() ** 2))
+    variables: dict[str, Any] = {
+        "books": {"offset": rng.randrange(0, max(args.books - 20, 1)), "like": rng.choice([None, *WORDS])},
+        "booksDeep": {
+            "ids": [book_id(dataset, rng.randrange(args.books)) for _ in range(rng.randint(1, 10))]
+        },
+        "authors": {"offset": rng.randrange(0, max(dataset.authors - 20, 1))},
+        "reviewsDeep": {"books": [book]},
+        "createReview": {"book": book, "stars": rng.randint(1, 5)},
+        "updateReview": {"book": book, "stars": rng.randint(1, 5)},
+        "deleteReview": {"book": book},
+    }[operation]
+    return operation, variables, f"bench-user-{rng.randrange(args.users)}"
+
+
+async def replay(args: argparse.Namespace) -> dict[str, list[tuple[float, int, bool]]]:
+    import httpx
+    from api.graphql.resolvers import resolvers
+    from api.graphql.route import create_graphql_route
+    from db.base import get_session
+    from fastapi import FastAPI
+
+    app = FastAPI()
+    app.add_api_route("/graphql", create_graphql_route(resolvers, get_session), methods=["POST"])
+    rng = random.Random(args.seed)
+    warm_up = [next_request(rng, args) for _ in range(args.requests // 10)]
+    requests = [next_request(rng, args) for _ in range(args.requests)]
+    samples: dict[str, list[tuple[float, int, bool]]] = {operation: [] for operation in QUERIES}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://benchmark",
+        headers={"Authorization": "Bearer benchmark"},
+    ) as client:
+
+        async def send(operation: str, variables: dict, user: str) -> None:
+            counter = [0]
+            round_trips.set(counter)
+            started = time.perf_counter()
+            response = await client.post(
+                "/graphql",
+                json={"query": QUERIES[operation][1], "variables": variables},
+                headers={"X-Client-Token": user},
+            )
+            elapsed = time.perf_counter() - started
+            body = response.json()
+            ok = response.status_code == 200 and not body.get("errors")
+            samples[operation].append((elapsed, counter[0], ok))
+
+        async def worker(stream: list[tuple[str, dict, str]], offset: int) -> None:
+            step = args.concurrency
+            for operation, variables, user in stream[offset::step]:
+                await send(operation, variables, user)
+
+        await asyncio.gather(*(worker(warm_up, offset) for offset in range(args.concurrency)))
+        for operation in samples:
+            samples[operation].clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(requests, offset) for offset in range(args.concurrency)))
+        samples["_elapsed"] = [(time.perf_counter() - started, 0, True)]
+    return samples
+
+
+async def run(args: argparse.Namespace) -> dict[str, list[tuple[float, int, bool]]]:
+    await seed(args)
+    return await replay(args)
+
+
+def percentile(values: list[float], share: float) -> float:
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def summarize(samples: dict[str, list[tuple[float, int, bool]]]) -> dict[str, Any]:
+    elapsed = samples.pop("_elapsed")[0][0]
+    operations = {}
+    everything = [sample for operation_samples in samples.values() for sample in operation_samples]
+    for operation, operation_samples in [*samples.items(), ("total", everything)]:
+        if not operation_samples:
+            continue
+        latencies = sorted(sample[0] * 1000 for sample in operation_samples)
+        operations[operation] = {
+            "requests": len(operation_samples),
+            "errors": sum(not sample[2] for sample in operation_samples),
+            "qps": round(len(operation_samples) / elapsed, 1),
+            "mean_ms": round(statistics.mean(latencies), 3),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "round_trips": round(statistics.mean(sample[1] for sample in operation_samples), 2),
+        }
+    return operations
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict[str, Any], path: str, threshold: float) -> bool:
+    with open(path, encoding="utf-8") as file:
+        baseline = json.load(file)["operations"]
+    print(f"\ncompared with {path}")
+    regressed = False
+    for operation, result in current.items():
+        if operation not in baseline:
+            continue
+        before = baseline[operation]
+        change = result["p99_ms"] / before["p99_ms"] - 1 if before["p99_ms"] else 0.0
+        regressed |= change > threshold
+        print(
+            f"{operation:<14} p99 {before['p99_ms']:>9.2f} -> {result['p99_ms']:>9.2f} ms ({change:+.0%})"
+            f"   qps {before['qps']:>8.1f} -> {result['qps']:>8.1f}"
+            f"{'   REGRESSION' if change > threshold else ''}"
+        )
+    return not regressed
+
+
+def main() -> None:
+    args = parse_args()
+    database_url = args.database_url or f"sqlite+aiosqlite:///{tempfile.gettempdir()}/books-benchmark.db"
+    os.environ["DATABASE_URL"] = database_url
+
+    stub_token_verification()
+    count_round_trips()
+    operations = summarize(asyncio.run(run(args)))
+
+    header = f"{'requests':>9}{'errors':>7}{'qps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'trips':>7}"
+    print(f"\n{'operation':<14}{header}")
+    for operation, result in operations.items():
+        print(
+            f"{operation:<14}{result['requests']:>9}{result['errors']:>7}{result['qps']:>9.1f}"
+            f"{result['p50_ms']:>8.2f}ms{result['p95_ms']:>8.2f}ms{result['p99_ms']:>8.2f}ms"
+            f"{result['round_trips']:>7.1f}"
+        )
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", f"load-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "date": datetime.now(timezone.utc).isoformat(),
+                "revision": git_revision(),
+                "database": database_url.split("://")[0],
+                "parameters": {
+                    key: getattr(args, key)
+                    for key in ("books", "reviews", "users", "requests", "concurrency", "seed")
+                },
+                "operations": operations,
+            },
+            file,
+            indent=2,
+        )
+    print(f"\nresults written to {output}")
+    if args.compare and not compare(operations, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Load test of the logging overhead seen by concurrent requests on the event loop.
+
+Each simulated request logs its SQL statement and the SQLAlchemy echo of its execution, as the
+resolvers did. "before" writes every record synchronously through a `FileHandler` with the echo
+always on. "after" is the current pipeline of `logs.setup_logging`: the records are queued for
+the writer thread, the statements are sampled at `LOG_SQL_SAMPLE_RATE` and the echo is off.
+
+Usage:
+    python benchmarks/logging_overhead.py [requests] [concurrency]
+"""
+
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from logs import setup_logging  # noqa: E402
+
+SQL = (
+    "SELECT books.id, books.title, books.publisher, books.description FROM books "
+    "WHERE books.title LIKE $1::VARCHAR AND books.language IN ($2::VARCHAR, $3::VARCHAR) "
+    "ORDER BY books.id LIMIT $4::INTEGER OFFSET $5::INTEGER"
+)
+
+
+def legacy_logging(directory: str) -> tuple[logging.Logger, logging.Logger]:
+    handler = logging.FileHandler(os.path.join(directory, "before.log"))
+    handler.setFormatter(logging.Formatter("%(levelname)s | %(asctime)s | %(module)s | %(message)s"))
+    logger = logging.getLogger("benchmark.before")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    echo = logging.getLogger("benchmark.before.sqlalchemy")
+    echo.setLevel(logging.INFO)
+    return logger, echo
+
+
+async def request(logger: logging.Logger, echo: logging.Logger, sample_rate: float) -> float:
+    started = time.perf_counter()
+    if logger.isEnabledFor(logging.INFO) and random.random() < sample_rate:
+        logger.info(SQL)
+    echo.info(SQL)
+    echo.info("[cached since 12.3s ago] ('%%war%%', 'en', 'ru', 10, 0)")
+    await asyncio.sleep(0)
+    return (time.perf_counter() - started) * 1e6
+
+
+async def run(logger: logging.Logger, echo: logging.Logger, sample_rate: float, total: int, concurrency: int):
+    latencies: list[float] = []
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            latencies.append(await request(logger, echo, sample_rate))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(total // concurrency) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(len(latencies) * 0.99)], len(latencies) / elapsed
+
+
+async def main(total: int, concurrency: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        before = await run(*legacy_logging(directory), 1.0, total, concurrency)
+        logger, _ = setup_logging(
+            "benchmark.after", os.path.join(directory, "after.log"), "INFO", "OFF", error_interval=60
+        )
+        after = await run(logger, logging.getLogger("sqlalchemy.engine.Engine"), 0.01, total, concurrency)
+
+    print(f"requests: {total}, concurrency: {concurrency}")
+    print(f"{'':<8}{'mean':>12}{'p99':>12}{'requests/s':>14}")
+    for name, (mean, p99, throughput) in (("before", before), ("after", after)):
+        print(f"{name:<8}{mean:>9.1f} us{p99:>9.1f} us{throughput:>14.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+        )
+    )
@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the per-request SQL construction and compilation of the resolver filter chains.
+
+"before" reproduces the previous behaviour: the `Stmt` chain is built, rendered by `stmt.log()`
+whatever the log level, and compiled through the engine's compiled cache. "after" skips the
+rendering unless INFO logging is enabled, so only the cache key of the statement is computed.
+"uncached" compiles the statement from scratch, which is what every request would pay without
+the compiled cache. The hits column confirms that the requests after the first one reuse the
+compiled form although their parameter values differ.
+
+Usage:
+    python benchmarks/statement_compile.py [iterations]
+"""
+
+import os
+import sys
+import time
+from itertools import cycle
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from api.graphql.resolvers import _authors_stmt, _books_stmt, _reviews_stmt  # noqa: E402
+from db.models import Author, Book, Review  # noqa: E402
+from db.statements import log_statement  # noqa: E402
+from patisson_graphql.stmt_filter import Stmt  # noqa: E402
+from sqlalchemy.dialects.postgresql.asyncpg import PGDialect_asyncpg  # noqa: E402
+from sqlalchemy.engine.interfaces import CacheStats  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+from sqlalchemy.util import LRUCache  # noqa: E402
+
+DIALECT = PGDialect_asyncpg()
+
+SHAPES = {
+    "books": lambda i: _books_stmt(
+        Stmt(select(Book.id, Book.title)),
+        like_title=f"war {i}",
+        from_pageCount=i % 500,
+        languages=["en", "ru"][: i % 2 + 1],
+        authors=[f"author {i}"],
+    )
+    .offset(i % 50)
+    .limit(10)
+    .ordered_by(Book.id),
+    "authors": lambda i: _authors_stmt(Stmt(select(Author)), like_names=f"tol{i}")
+    .offset(i % 50)
+    .limit(10)
+    .ordered_by(Author.name),
+    "reviews": lambda i: _reviews_stmt(Stmt(select(Review)), books=[f"book {i}"], from_stars=i % 5)
+    .offset(i % 50)
+    .limit(10)
+    .ordered_by(Review.id),
+}
+
+
+def compile_cached(stmt, cache: LRUCache) -> CacheStats:
+    _, _, cache_hit = stmt._compile_w_cache(DIALECT, compiled_cache=cache, column_keys=[])
+    return cache_hit
+
+
+def measure(build, iterations: int, render: bool, cache) -> tuple[float, int]:
+    hits = 0
+    values = cycle(range(1000))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        stmt = build(next(values))
+        if render:
+            stmt.log()
+        else:
+            log_statement(stmt)
+        if cache is None:
+            stmt().compile(dialect=DIALECT)
+        else:
+            hits += compile_cached(stmt(), cache) is CacheStats.CACHE_HIT
+    return (time.perf_counter() - started) / iterations * 1e6, hits
+
+
+def main(iterations: int) -> None:
+    print(f"iterations: {iterations}")
+    print(f"{'resolver':<10}{'uncached':>12}{'before':>12}{'after':>12}{'hits':>10}")
+    for name, build in SHAPES.items():
+        uncached, _ = measure(build, iterations, render=False, cache=None)
+        before, _ = measure(build, iterations, render=True, cache=LRUCache(500))
+        after, hits = measure(build, iterations, render=False, cache=LRUCache(500))
+        print(f"{name:<10}{uncached:>9.1f} us{before:>9.1f} us{after:>9.1f} us{hits:>10}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)